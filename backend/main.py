@@ -1,10 +1,17 @@
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from backend.services.db_service import connect_to_mongo, close_mongo_connection
+from backend.services.db_service import connect_to_mongo, close_mongo_connection, get_db
+from backend.services.index_service import ensure_indexes
+from backend.services.schema_catalog import run_catalog_rebuilds
+from backend.services.facet_service import run_facet_rebuilds
+from backend.services.translation_layer.utils.schema_snapshot import schema_snapshot
+from backend.services.translation_layer.factory import get_llm_client, close_llm_client
 from backend.routes.db_routes import db_router
 from backend.routes.llm_routes import llm_router
+from backend.routes.admin_routes import admin_router
 
 # Configure logging globally
 logging.basicConfig(
@@ -16,8 +23,21 @@ logging.basicConfig(
 async def lifespan(app: FastAPI):
     # Startup
     await connect_to_mongo()
+    await ensure_indexes(get_db())
+    # Builds the metadata catalog once for databases ingested before it existed,
+    # then rebuilds collections updated in place by upsert ingest
+    catalog_rebuilds = asyncio.create_task(run_catalog_rebuilds(get_db()))
+    # Keeps the schema used by the LLM prompt and validation warm
+    schema_refresh = asyncio.create_task(schema_snapshot.run(get_db()))
+    # Periodically recomputes the dashboard facet counts
+    facet_rebuilds = asyncio.create_task(run_facet_rebuilds(get_db()))
+    get_llm_client()
     yield
     # Shutdown
+    catalog_rebuilds.cancel()
+    schema_refresh.cancel()
+    facet_rebuilds.cancel()
+    await close_llm_client()
     await close_mongo_connection()
 
 app = FastAPI(
@@ -38,3 +58,4 @@ app.add_middleware(
 
 app.include_router(db_router)
 app.include_router(llm_router)
+app.include_router(admin_router)
@@ -101,9 +101,13 @@ class SeriesModel(BaseModel):
 
     metadata: dict = {}
 
-    # Links
+    # Links (instances point here via series_id; nothing grows per instance)
     collection_ids: List[PyObjectId] = []
-    instances: List[PyObjectId] = []
+
+    # Instance summary, maintained by the instance insert endpoints
+    instance_count: int = 0
+    min_instance_number: Optional[int] = None
+    max_instance_number: Optional[int] = None
     
 
     # for natural-language later:
@@ -0,0 +1,59 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pymongo.errors import PyMongoError
+from backend.services.db_service import get_db
+from backend.services.index_service import get_index_stats
+from backend.services.migrations import migrate_series_instance_links, dedupe_uids
+from backend.services.facet_service import rebuild_all_facets
+from backend.services.schema_catalog import CATALOGED_COLLECTIONS, rebuild_catalog
+
+admin_router = APIRouter()
+
+@admin_router.get("/admin/indexes", summary="Index usage per collection from $indexStats")
+async def index_stats(db=Depends(get_db)):
+    try:
+        return await get_index_stats(db)
+    except PyMongoError as e:
+        raise HTTPException(status_code=500, detail=f"MongoDB error: {str(e)}")
+
+@admin_router.post(
+    "/admin/migrations/series-instance-links",
+    summary="Replace legacy series.instances arrays with instance summary fields"
+)
+async def series_instance_links_migration(
+    recount_all: bool = Query(False, description="Recompute the summary of every series, not only legacy ones"),
+    db=Depends(get_db)
+):
+    try:
+        return await migrate_series_instance_links(db, recount_all=recount_all)
+    except PyMongoError as e:
+        raise HTTPException(status_code=500, detail=f"MongoDB error: {str(e)}")
+
+@admin_router.post(
+    "/admin/migrations/dedupe-uids",
+    summary="Merge documents sharing a study/series/SOP instance UID and build the unique UID indexes"
+)
+async def dedupe_uids_migration(db=Depends(get_db)):
+    try:
+        return await dedupe_uids(db)
+    except PyMongoError as e:
+        raise HTTPException(status_code=500, detail=f"MongoDB error: {str(e)}")
+
+@admin_router.post("/admin/facets/rebuild", summary="Recompute the materialized facet counts")
+async def facets_rebuild(db=Depends(get_db)):
+    try:
+        return await rebuild_all_facets(db)
+    except PyMongoError as e:
+        raise HTTPException(status_code=500, detail=f"MongoDB error: {str(e)}")
+
+@admin_router.post("/admin/schema-catalog/rebuild", summary="Recompute the metadata-field catalog")
+async def schema_catalog_rebuild(
+    collection: Optional[str] = Query(None, description="Collection to rebuild (default: all)"),
+    db=Depends(get_db)
+):
+    if collection is not None and collection not in CATALOGED_COLLECTIONS:
+        raise HTTPException(status_code=400, detail="Invalid collection name")
+    try:
+        return {c: await rebuild_catalog(db, c) for c in ([collection] if collection else CATALOGED_COLLECTIONS)}
+    except PyMongoError as e:
+        raise HTTPException(status_code=500, detail=f"MongoDB error: {str(e)}")
@@ -1,12 +1,34 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Body, Query
-from pymongo.errors import PyMongoError
+from pymongo.errors import PyMongoError, BulkWriteError, DuplicateKeyError, ExecutionTimeout
+from pydantic import ValidationError
 from backend.models.models import ResearcherModel, CollectionModel, StudyModel, SeriesModel, InstanceModel
 from backend.services.db_service import get_db
+from backend.services.pagination import sort_spec, encode_cursor, decode_cursor, keyset_filter
+from backend.services.count_service import count_total, COUNT_CAP
+from backend.services.schema_catalog import record_metadata_fields, get_metadata_fields, get_catalog, mark_catalog_stale
+from backend.services.facet_service import FACETS, record_facets, get_facets, mark_facets_stale
+from backend.services import query_guard
+from backend.services.hierarchy_query import (
+    LEVELS, LOOKUP_FIELDS, HIERARCHY_MAX_IDS, TooBroad, SemiJoinPlan, estimate_levels, lookup_stages, count_lookup
+)
+from backend.services.parent_cache import parent_cache
+from backend.services.index_service import has_unique_index
+from backend.services.document_paths import is_valid_path, json_default, prune_paths
+from backend.services.export_service import (
+    EXPORT_MEDIA_TYPES, resolve_columns, column_projection, stream_csv, stream_arrow
+)
+from backend.services.study_tree import (
+    study_tree_pipeline, tree_cache, STUDY_TREE_CACHE_TTL, TREE_INSTANCES_PER_SERIES, TREE_MAX_INSTANCES_PER_SERIES
+)
 from datetime import datetime, timezone
+from collections import defaultdict
+from typing import Any, Dict, List, Literal, Optional
 from bson import ObjectId
 import traceback
-from fastapi.responses import JSONResponse
-from pymongo import MongoClient
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pymongo import MongoClient, UpdateOne
+import asyncio
+import json
 import logging
 logger = logging.getLogger(__name__)
 
@@ -17,8 +39,214 @@ MODEL_MAP = {
     # Add more as needed
 }
 
+# Upper bound on the number of records accepted by a single bulk request
+MAX_BULK_SIZE = 5000
+
+# Upsert ingest: the DICOM UID each collection is keyed on (unique indexes),
+# fields only written when the document is created (links and summaries
+# maintained by other endpoints), and link arrays merged instead of replaced
+UPSERT_KEYS = {
+    'studies': 'study_instance_uid',
+    'series': 'series_instance_uid',
+    'instances': 'sop_instance_uid',
+}
+INSERT_ONLY_FIELDS = {
+    'studies': ('series', 'created_at'),
+    'series': ('instance_count', 'min_instance_number', 'max_instance_number', 'created_at'),
+    'instances': ('created_at',),
+}
+MERGED_FIELDS = ('collection_ids',)
+# Collections whose unique UID index has been seen, so upserts can rely on it
+_unique_uid_indexes = set()
+
 db_router = APIRouter()
 
+# --- Bulk ingest helpers ---
+
+def _format_validation_error(e: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in e.errors()
+    )
+
+def _validate_records(model, records: List[Dict[str, Any]]):
+    """
+    Validates every raw record against `model` on its own, so one bad element
+    doesn't fail the whole batch. Returns the (index, model) pairs that passed
+    and a per-element results list pre-filled with the validation errors.
+    """
+    if len(records) > MAX_BULK_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Bulk requests are limited to {MAX_BULK_SIZE} records"
+        )
+    results: List[Any] = [None] * len(records)
+    valid = []
+    for idx, record in enumerate(records):
+        try:
+            valid.append((idx, model(**record)))
+        except ValidationError as e:
+            results[idx] = {"index": idx, "error": _format_validation_error(e)}
+    return valid, results
+
+async def _drop_orphans(db, parent_collection, child_collection, parent_key, written, results, error):
+    """
+    Called when a link update matched fewer parents than it targeted: a parent
+    was deleted after the (possibly cached) existence check. Deletes the
+    children written under the missing parents, marks them failed and forgets
+    the parents. Returns the pairs that are still written.
+    """
+    parent_ids = {payload[parent_key] for _, payload in written}
+    cursor = db[parent_collection].find({"_id": {"$in": list(parent_ids)}}, {"_id": 1})
+    gone = parent_ids - {doc["_id"] async for doc in cursor}
+    parent_cache.invalidate(parent_collection, gone)
+    orphans = [(idx, payload) for idx, payload in written if payload[parent_key] in gone]
+    if orphans:
+        await db[child_collection].delete_many({"_id": {"$in": [payload["_id"] for _, payload in orphans]}})
+        for idx, _ in orphans:
+            results[idx] = {"index": idx, "error": error}
+    return [(idx, payload) for idx, payload in written if payload[parent_key] not in gone]
+
+async def _insert_unordered(collection, items, results):
+    """
+    Writes (index, payload) pairs with a single unordered insert_many and records
+    each element's outcome in `results`. Returns the pairs that were written.
+    """
+    if not items:
+        return []
+    failed = {}
+    try:
+        await collection.insert_many([payload for _, payload in items], ordered=False)
+    except BulkWriteError as e:
+        for err in e.details.get("writeErrors", []):
+            failed[err["index"]] = err.get("errmsg", "Write error")
+
+    written = []
+    for pos, (idx, payload) in enumerate(items):
+        if pos in failed:
+            results[idx] = {"index": idx, "error": failed[pos]}
+        else:
+            results[idx] = {"index": idx, "inserted_id": str(payload["_id"])}
+            written.append((idx, payload))
+    return written
+
+async def _upsert_unordered(collection, items, results):
+    """
+    Upserts (index, payload) pairs keyed on the collection's UID with a single
+    unordered bulk_write. New documents keep the payload's _id; existing ones
+    are updated in place, and re-sending unchanged records is a no-op on the
+    server. Returns the written pairs (payloads carry the stored _id) and the
+    indexes of the records that created a document.
+    """
+    if not items:
+        return [], set()
+    key = UPSERT_KEYS[collection.name]
+    if collection.name not in _unique_uid_indexes:
+        # Without the unique index (its build fails over duplicates left by
+        # older re-imports) an upsert would update an arbitrary duplicate
+        if not await has_unique_index(collection.database, collection.name, key):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Upsert needs the unique index on {collection.name}.{key}; "
+                       "run POST /admin/migrations/dedupe-uids to remove duplicates and build it"
+            )
+        _unique_uid_indexes.add(collection.name)
+    ops = []
+    for _, payload in items:
+        fields = dict(payload)
+        update = {"$setOnInsert": {"_id": fields.pop("_id")}}
+        for field in INSERT_ONLY_FIELDS[collection.name]:
+            if field in fields:
+                update["$setOnInsert"][field] = fields.pop(field)
+        merged = {}
+        for field in MERGED_FIELDS:
+            if field not in fields:
+                continue
+            values = fields.pop(field)
+            if values:
+                merged[field] = {"$each": values}
+            else:
+                # Nothing to merge: new documents still get the empty list, like inserts
+                update["$setOnInsert"][field] = []
+        if merged:
+            update["$addToSet"] = merged
+        update["$set"] = fields
+        ops.append(UpdateOne({key: payload[key]}, update, upsert=True))
+
+    failed = {}
+    try:
+        details = (await collection.bulk_write(ops, ordered=False)).bulk_api_result
+    except BulkWriteError as e:
+        details = e.details
+        for err in details.get("writeErrors", []):
+            failed[err["index"]] = err.get("errmsg", "Write error")
+    upserted = {u["index"]: u["_id"] for u in details.get("upserted", [])}
+
+    # Records that matched an existing document: fetch the stored ids
+    matched_uids = [payload[key] for pos, (_, payload) in enumerate(items) if pos not in upserted and pos not in failed]
+    stored = {}
+    if matched_uids:
+        cursor = collection.find({key: {"$in": matched_uids}}, {"_id": 1, key: 1})
+        stored = {doc[key]: doc["_id"] async for doc in cursor}
+
+    written, created = [], set()
+    for pos, (idx, payload) in enumerate(items):
+        if pos in failed:
+            results[idx] = {"index": idx, "error": failed[pos]}
+            continue
+        if pos in upserted:
+            created.add(idx)
+        else:
+            payload = {**payload, "_id": stored[payload[key]]}
+        results[idx] = {"index": idx, "inserted_id": str(payload["_id"]), "created": idx in created}
+        written.append((idx, payload))
+    return written, created
+
+async def _write_records(collection, items, results, upsert):
+    # Returns (written pairs, indexes of newly created documents)
+    if upsert:
+        return await _upsert_unordered(collection, items, results)
+    written = await _insert_unordered(collection, items, results)
+    return written, {idx for idx, _ in written}
+
+def _mark_updated_stale(collection, written, created):
+    # Upserts that updated existing documents may have changed their metadata
+    # and facet values; the recorders only count new documents, so have the
+    # catalog and facet counts of the collection rebuilt in the background
+    if any(idx not in created for idx, _ in written):
+        mark_catalog_stale(collection)
+        mark_facets_stale(collection)
+
+def _bulk_response(results):
+    inserted = sum(1 for r in results if "inserted_id" in r)
+    return {"inserted": inserted, "failed": len(results) - inserted, "results": results}
+
+def _instance_summary_update(instance_numbers: List[Optional[int]], new_count: Optional[int] = None) -> dict:
+    """
+    Update that folds newly inserted instances into their series' summary
+    fields, in place of appending each instance id to the series document.
+    `new_count` is the number of instances that are new (re-sent instances
+    only refresh the min/max); by default all of them.
+    """
+    new_count = len(instance_numbers) if new_count is None else new_count
+    update = {"$inc": {"instance_count": new_count}} if new_count else {}
+    numbers = [n for n in instance_numbers if n is not None]
+    if numbers:
+        update["$min"] = {"min_instance_number": min(numbers)}
+        update["$max"] = {"max_instance_number": max(numbers)}
+    return update
+
+
+def _shallow_series(series: SeriesModel, series_id) -> dict:
+    # Shallow reference to a series that is embedded in its parent study
+    return {
+        "series_id": series_id,
+        "series_instance_uid": series.series_instance_uid,
+        "series_number": series.series_number,
+        "series_description": series.metadata.get("SeriesDescription", ""),
+        "modality": series.metadata.get("Modality", "")
+    }
+
+
 @db_router.post(
     "/researchers",
     status_code=status.HTTP_201_CREATED,
@@ -123,9 +351,17 @@ async def create_study(study: StudyModel, db=Depends(get_db)):
     try:
         result = await db["studies"].insert_one(payload)
         inserted_id = result.inserted_id
+        parent_cache.add("studies", [inserted_id])
+        await record_metadata_fields(db, "studies", [payload])
+        await record_facets(db, "studies", [payload])
 
         return {"inserted_id": str(inserted_id)}
 
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A study with this study_instance_uid already exists"
+        )
     except PyMongoError:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -133,6 +369,39 @@ async def create_study(study: StudyModel, db=Depends(get_db)):
         )
 
 
+@db_router.post(
+    "/studies/bulk",
+    status_code=status.HTTP_201_CREATED,
+    response_model=dict,
+    summary="Insert a batch of studies"
+)
+async def create_studies_bulk(
+    studies: List[Dict[str, Any]] = Body(..., description="Array of study documents"),
+    upsert: bool = Query(False, description="Insert or update by study_instance_uid, so re-imports are idempotent"),
+    db=Depends(get_db)
+):
+    """
+    Inserts studies with one unordered insert_many (or, with upsert, one
+    bulk_write of UID-keyed upserts). Each element gets its own result, so a
+    bad record doesn't fail the rest of the batch.
+    """
+    valid, results = _validate_records(StudyModel, studies)
+    to_insert = [(idx, study.model_dump(by_alias=True, exclude_none=True)) for idx, study in valid]
+    try:
+        written, created = await _write_records(db["studies"], to_insert, results, upsert)
+        parent_cache.add("studies", [payload["_id"] for _, payload in written])
+        new = [payload for idx, payload in written if idx in created]
+        await record_metadata_fields(db, "studies", new)
+        await record_facets(db, "studies", new)
+        _mark_updated_stale("studies", written, created)
+    except PyMongoError:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Database error during bulk study insertion"
+        )
+    return _bulk_response(results)
+
+
 @db_router.get(
     "/studies/{study_id}",
     response_model=StudyModel,
@@ -148,6 +417,59 @@ async def get_study(study_id: str, db=Depends(get_db)):
         raise HTTPException(status_code=400, detail=str(e))
 
 
+def _tree_projection(fields: Optional[str], include_metadata: bool) -> Optional[dict]:
+    # Comma-separated include list, or everything but metadata by default
+    if fields:
+        return build_projection([f.strip() for f in fields.split(",") if f.strip()], None, [])
+    return None if include_metadata else {"metadata": 0}
+
+
+@db_router.get("/studies/{study_id}/tree", summary="Get a study with its series and instances in one call")
+async def get_study_tree(
+    study_id: str,
+    depth: int = Query(2, ge=0, le=2, description="0: study only, 1: with series, 2: with series and instances"),
+    study_fields: Optional[str] = Query(None, description="Comma-separated study fields to return"),
+    series_fields: Optional[str] = Query(None, description="Comma-separated series fields to return"),
+    instance_fields: Optional[str] = Query(None, description="Comma-separated instance fields to return"),
+    include_metadata: bool = Query(False, description="Include the metadata of documents without a field list"),
+    max_instances: int = Query(
+        TREE_INSTANCES_PER_SERIES, ge=1, le=TREE_MAX_INSTANCES_PER_SERIES,
+        description="Max instances returned per series (lowest instance numbers first)"
+    ),
+    db=Depends(get_db)
+):
+    """
+    Returns the study with its series and their instances embedded, from a
+    single aggregation, instead of one request per child. Documents are
+    returned as stored (no model round trip); series carry instance_count, so
+    a truncated instance list can be detected. Responses are cached for
+    STUDY_TREE_CACHE_TTL seconds.
+    """
+    if not ObjectId.is_valid(study_id):
+        raise HTTPException(status_code=400, detail="Invalid study ID")
+    key = (study_id, depth, study_fields, series_fields, instance_fields, include_metadata, max_instances)
+    body = tree_cache.get(key) if STUDY_TREE_CACHE_TTL > 0 else None
+    if body is None:
+        pipeline = study_tree_pipeline(
+            ObjectId(study_id),
+            depth,
+            _tree_projection(study_fields, include_metadata),
+            _tree_projection(series_fields, include_metadata),
+            _tree_projection(instance_fields, include_metadata),
+            max_instances,
+        )
+        try:
+            docs = await db["studies"].aggregate(pipeline).to_list(length=1)
+        except PyMongoError as e:
+            raise HTTPException(status_code=500, detail=f"MongoDB error: {str(e)}")
+        if not docs:
+            raise HTTPException(status_code=404, detail="Study not found")
+        body = _encoder.encode(serialize_document(docs[0]))
+        if STUDY_TREE_CACHE_TTL > 0:
+            tree_cache.set(key, body)
+    return Response(content=body, media_type="application/json")
+
+
 
 @db_router.post(
     "/series",
@@ -156,9 +478,8 @@ async def get_study(study_id: str, db=Depends(get_db)):
     summary="Insert a new series and link to study"
 )
 async def create_series(series: SeriesModel, db=Depends(get_db)):
-    # Step 1: Validate that the referenced study exists
-    study = await db["studies"].find_one({"_id": series.study_id})
-    if not study:
+    # Step 1: Validate that the referenced study exists (cached across inserts)
+    if not await parent_cache.exists(db, "studies", series.study_id):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Referenced study_id does not exist"
@@ -171,27 +492,105 @@ async def create_series(series: SeriesModel, db=Depends(get_db)):
         inserted_id = result.inserted_id
 
         # Step 3: Add a shallow reference in the study document
-        shallow_series = {
-            "series_id": inserted_id,
-            "series_instance_uid": series.series_instance_uid,
-            "series_number": series.series_number,
-            "series_description": series.metadata.get("SeriesDescription", ""),
-            "modality": series.metadata.get("Modality", "")
-        }
+        shallow_series = _shallow_series(series, inserted_id)
 
-        await db["studies"].update_one(
+        link = await db["studies"].update_one(
             {"_id": series.study_id},
             {"$addToSet": {"series": shallow_series}}
         )
+        if link.matched_count == 0:
+            # The study was deleted after the existence check
+            await db["series"].delete_one({"_id": inserted_id})
+            parent_cache.invalidate("studies", [series.study_id])
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Referenced study_id does not exist"
+            )
+        parent_cache.add("series", [inserted_id])
+        await record_metadata_fields(db, "series", [payload])
+        await record_facets(db, "series", [payload])
 
         return {"inserted_id": str(inserted_id)}
 
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="A series with this series_instance_uid already exists"
+        )
     except PyMongoError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Database error during series insertion"
         )
 
+
+@db_router.post(
+    "/series/bulk",
+    status_code=status.HTTP_201_CREATED,
+    response_model=dict,
+    summary="Insert a batch of series and link them to their studies"
+)
+async def create_series_bulk(
+    series_list: List[Dict[str, Any]] = Body(..., description="Array of series documents"),
+    upsert: bool = Query(False, description="Insert or update by series_instance_uid, so re-imports are idempotent"),
+    db=Depends(get_db)
+):
+    valid, results = _validate_records(SeriesModel, series_list)
+    try:
+        # Step 1: Validate all referenced studies with at most one lookup
+        existing = await parent_cache.filter_existing(db, "studies", {s.study_id for _, s in valid})
+        to_insert = []
+        for idx, s in valid:
+            if s.study_id not in existing:
+                results[idx] = {"index": idx, "error": "Referenced study_id does not exist"}
+            else:
+                to_insert.append((idx, s.model_dump(by_alias=True, exclude_none=True)))
+
+        # Step 2: Insert (or upsert) the series documents
+        written, created = await _write_records(db["series"], to_insert, results, upsert)
+        new = [(idx, payload) for idx, payload in written if idx in created]
+        models = dict(valid)
+
+        # Step 3: Add the shallow references of new series to the studies in one bulk_write
+        links = defaultdict(list)
+        for idx, payload in new:
+            links[payload["study_id"]].append(_shallow_series(models[idx], payload["_id"]))
+        if links:
+            linked = await db["studies"].bulk_write(
+                [UpdateOne({"_id": study_id}, {"$addToSet": {"series": {"$each": shallow}}})
+                 for study_id, shallow in links.items()],
+                ordered=False
+            )
+            if linked.matched_count < len(links):
+                kept = await _drop_orphans(
+                    db, "studies", "series", "study_id", new, results, "Referenced study_id does not exist"
+                )
+                # Deleted orphans must not be cached as existing parents
+                dropped = {idx for idx, _ in new} - {idx for idx, _ in kept}
+                new = kept
+                written = [(idx, payload) for idx, payload in written if idx not in dropped]
+        # Re-sent series refresh their existing reference in place
+        refreshed = [
+            UpdateOne(
+                {"_id": payload["study_id"], "series.series_id": payload["_id"]},
+                {"$set": {"series.$": _shallow_series(models[idx], payload["_id"])}}
+            )
+            for idx, payload in written if idx not in created
+        ]
+        if refreshed:
+            await db["studies"].bulk_write(refreshed, ordered=False)
+
+        parent_cache.add("series", [payload["_id"] for _, payload in written])
+        await record_metadata_fields(db, "series", [payload for _, payload in new])
+        await record_facets(db, "series", [payload for _, payload in new])
+        _mark_updated_stale("series", written, created)
+    except PyMongoError:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Database error during bulk series insertion"
+        )
+    return _bulk_response(results)
+
 @db_router.get(
     "/series/{series_id}",
     response_model=SeriesModel,
@@ -214,9 +613,8 @@ async def get_series(series_id: str, db=Depends(get_db)):
     summary="Insert a new instance and link to series"
 )
 async def create_instance(instance: InstanceModel, db=Depends(get_db)):
-    # Step 1: Validate that the referenced series exists
-    series = await db["series"].find_one({"_id": instance.series_id})
-    if not series:
+    # Step 1: Validate that the referenced series exists (cached across inserts)
+    if not await parent_cache.exists(db, "series", instance.series_id):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Referenced series_id does not exist"
@@ -228,20 +626,92 @@ async def create_instance(instance: InstanceModel, db=Depends(get_db)):
         result = await db["instances"].insert_one(payload)
         inserted_id = result.inserted_id
 
-        # Step 3: Update the parent series document to include this instance
-        await db["series"].update_one(
+        # Step 3: Update the parent series' instance summary
+        link = await db["series"].update_one(
             {"_id": instance.series_id},
-            {"$addToSet": {"instances": inserted_id}}
+            _instance_summary_update([instance.instance_number])
         )
+        if link.matched_count == 0:
+            # The series was deleted after the existence check
+            await db["instances"].delete_one({"_id": inserted_id})
+            parent_cache.invalidate("series", [instance.series_id])
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Referenced series_id does not exist"
+            )
+        await record_metadata_fields(db, "instances", [payload])
 
         return {"inserted_id": str(inserted_id)}
 
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="An instance with this sop_instance_uid already exists"
+        )
     except PyMongoError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Database error during instance insertion"
         )
 
+
+@db_router.post(
+    "/instances/bulk",
+    status_code=status.HTTP_201_CREATED,
+    response_model=dict,
+    summary="Insert a batch of instances and link them to their series"
+)
+async def create_instances_bulk(
+    instances: List[Dict[str, Any]] = Body(..., description="Array of instance documents"),
+    upsert: bool = Query(False, description="Insert or update by sop_instance_uid, so re-imports are idempotent"),
+    db=Depends(get_db)
+):
+    valid, results = _validate_records(InstanceModel, instances)
+    try:
+        # Step 1: Validate all referenced series with at most one lookup
+        existing = await parent_cache.filter_existing(db, "series", {i.series_id for _, i in valid})
+        to_insert = []
+        for idx, inst in valid:
+            if inst.series_id not in existing:
+                results[idx] = {"index": idx, "error": "Referenced series_id does not exist"}
+            else:
+                to_insert.append((idx, inst.model_dump(by_alias=True, exclude_none=True)))
+
+        # Step 2: Insert (or upsert) the instance documents
+        written, created = await _write_records(db["instances"], to_insert, results, upsert)
+
+        # Step 3: Update the series' instance summaries in one bulk_write;
+        # only new instances are counted
+        numbers, new_counts = defaultdict(list), defaultdict(int)
+        for idx, payload in written:
+            numbers[payload["series_id"]].append(payload.get("instance_number"))
+            new_counts[payload["series_id"]] += idx in created
+        updates = {
+            series_id: _instance_summary_update(series_numbers, new_counts[series_id])
+            for series_id, series_numbers in numbers.items()
+        }
+        updates = {series_id: update for series_id, update in updates.items() if update}
+        if updates:
+            linked = await db["series"].bulk_write(
+                [UpdateOne({"_id": series_id}, update) for series_id, update in updates.items()],
+                ordered=False
+            )
+            if linked.matched_count < len(updates):
+                new = [(idx, payload) for idx, payload in written if idx in created]
+                kept = await _drop_orphans(
+                    db, "series", "instances", "series_id", new, results, "Referenced series_id does not exist"
+                )
+                dropped = {idx for idx, _ in new} - {idx for idx, _ in kept}
+                written = [(idx, payload) for idx, payload in written if idx not in dropped]
+        await record_metadata_fields(db, "instances", [payload for idx, payload in written if idx in created])
+        _mark_updated_stale("instances", written, created)
+    except PyMongoError:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Database error during bulk instance insertion"
+        )
+    return _bulk_response(results)
+
 @db_router.get(
     "/instances/{instance_id}",
     response_model=InstanceModel,
@@ -272,6 +742,76 @@ def serialize_document(doc):
     else:
         return doc
 
+# C-accelerated encoder that handles ObjectId on the fly
+_encoder = json.JSONEncoder(default=json_default, separators=(",", ":"))
+
+# Size of the chunks written by streamed /query responses
+STREAM_CHUNK_SIZE = 64 * 1024
+
+def encode_document(doc):
+    """
+    JSON-encodes a Mongo document like serialize_document() would, without the
+    recursive Python walk. Only the top-level `_id` is renamed to `id`.
+    """
+    if "_id" in doc:
+        doc = {"id": doc["_id"], **{k: v for k, v in doc.items() if k != "_id"}}
+    return _encoder.encode(doc)
+
+def _guard_warnings(guard):
+    return {"reason": guard["reason"], "suggestions": guard["suggestions"]}
+
+async def _stream_results(cursor, spec, limit, sort, count_task, guard, max_time_ms=None):
+    """
+    Streams a /query page as the same JSON object the buffered response returns,
+    encoding documents as they come off the cursor. A query time-boxed by the
+    cost guard that runs out mid-stream ends with the results read so far and
+    an "error" instead of the totals.
+    """
+    chunk = ['{"results":[']
+    try:
+        size = 0
+        count = 0
+        last = None
+        async for doc in cursor:
+            encoded = encode_document(doc)
+            chunk.append("," + encoded if count else encoded)
+            size += len(encoded)
+            count += 1
+            last = doc
+            if size >= STREAM_CHUNK_SIZE:
+                yield "".join(chunk)
+                chunk, size = [], 0
+
+        total, total_capped = await count_task
+        next_cursor = encode_cursor(last, spec) if last is not None and count == limit else None
+        trailer = {
+            "total": total,
+            "total_capped": total_capped,
+            "sort": sort,
+            "next_cursor": next_cursor
+        }
+        if guard["expensive"]:
+            trailer["warnings"] = _guard_warnings(guard)
+        chunk.append("]," + _encoder.encode(trailer)[1:])
+        yield "".join(chunk)
+    except ExecutionTimeout:
+        # Headers are already sent: close the results and say why they stop here
+        trailer = {
+            "sort": sort,
+            "error": {
+                "message": f"Query exceeded {max_time_ms} ms: {guard['reason']}",
+                "suggestions": guard["suggestions"]
+            },
+            "warnings": _guard_warnings(guard)
+        }
+        chunk.append("]," + _encoder.encode(trailer)[1:])
+        yield "".join(chunk)
+    except PyMongoError:
+        # Headers are already sent, so the truncated body is the only signal left
+        logger.exception("MongoDB error while streaming query results")
+    finally:
+        count_task.cancel()
+
 def convert_object_ids(query):
     if isinstance(query, dict):
         for k, v in query.items():
@@ -284,6 +824,33 @@ def convert_object_ids(query):
                 convert_object_ids(v)
     return query
 
+def build_projection(fields, exclude_fields, spec):
+    """
+    Builds a Mongo projection from an include list (`fields`) or an exclude list
+    (`exclude_fields`), so only the needed fields are read and serialized. "id"
+    means "_id". Sort keys are always kept, since next_cursor is built from them.
+    Returns None when whole documents are wanted.
+    """
+    if fields and exclude_fields:
+        raise HTTPException(status_code=400, detail="Use either fields or exclude_fields, not both")
+    requested = fields or exclude_fields
+    if not requested:
+        return None
+
+    for field in requested:
+        if not is_valid_path(field):
+            raise HTTPException(status_code=400, detail=f"Invalid projection field: {field!r}")
+    paths = prune_paths("_id" if field == "id" else field for field in requested)
+
+    sort_fields = {field for field, _ in spec}
+    if fields:
+        projection = {path: 1 for path in paths}
+        for field in sort_fields:
+            if not any(field == p or field.startswith(p + ".") for p in paths):
+                projection[field] = 1
+        return projection
+    return {path: 0 for path in paths if path not in sort_fields}
+
 @db_router.post("/query", summary="Query studies/series/instances/collections")
 async def run_query(
     collection: str = Body(..., description="studies, series, instances, or collections"),
@@ -291,37 +858,266 @@ async def run_query(
     limit: int = Body(default=1000, description="Max results to return"),
     skip: int = Body(default=0, description="Number of results to skip"),
     sort: dict = Body(default={}, description="Sort specification, e.g., {'field': 1} for ascending, {'field': -1} for descending"),
+    after: Optional[str] = Body(default=None, description="next_cursor from the previous page; replaces skip"),
+    count: Literal["exact", "capped", "none"] = Body(default="exact", description="How to compute total: exact, capped at count_cap, or none"),
+    count_cap: int = Body(default=COUNT_CAP, description="Upper bound on total when count is 'capped'"),
+    stream: bool = Body(default=False, description="Stream the response, encoding documents as they are read"),
+    fields: Optional[List[str]] = Body(default=None, description="Only return these fields, e.g. the selected table columns"),
+    exclude_fields: Optional[List[str]] = Body(default=None, description="Return everything except these fields, e.g. ['metadata']"),
     db=Depends(get_db)
 ):
     allowed_collections = {"studies", "series", "instances", "collections"}
     if collection not in allowed_collections:
         raise HTTPException(status_code=400, detail="Invalid collection name")
 
+    # _id is always the last sort key, so page boundaries are stable
+    spec = sort_spec(sort)
+    after_values = None
+    if after:
+        try:
+            after_values = decode_cursor(after, spec)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    projection = build_projection(fields, exclude_fields, spec)
+
     try:
         query = convert_object_ids(query)
-        cursor = db[collection].find(query)
-        
-        # Apply sorting if provided
-        if sort:
-            cursor = cursor.sort(list(sort.items()))
-        
+        page_query = query
+        if after_values is not None:
+            # Keyset pagination: seek past the last document of the previous page
+            keyset = keyset_filter(spec, after_values)
+            page_query = {"$and": [query, keyset]} if query else keyset
+
+        # Cost guard: explain the page query and reject or time-box full scans
+        guard = await query_guard.assess_query(
+            db, collection, page_query, spec, limit + (skip if after_values is None else 0)
+        )
+        if guard["expensive"] and query_guard.QUERY_GUARD_MODE == "reject":
+            raise HTTPException(
+                status_code=400,
+                detail={"message": f"Query too expensive: {guard['reason']}", "suggestions": guard["suggestions"]}
+            )
+        max_time_ms = None
+        if guard["expensive"] and query_guard.QUERY_GUARD_MODE == "limit":
+            max_time_ms = query_guard.QUERY_GUARD_MAX_TIME_MS
+
+        cursor = db[collection].find(page_query, projection)
+        if max_time_ms:
+            cursor = cursor.max_time_ms(max_time_ms)
+
+        # Apply sorting
+        cursor = cursor.sort(spec)
+
         # Apply pagination after sorting
-        cursor = cursor.skip(skip).limit(limit)
-        results = await cursor.to_list(length=limit)
-        
-        # Get total count for pagination
-        total = await db[collection].count_documents(query)
-        
-        return {
+        if after_values is None:
+            cursor = cursor.skip(skip)
+        cursor = cursor.limit(limit)
+
+        if stream:
+            count_task = asyncio.ensure_future(count_total(db[collection], query, count, count_cap, max_time_ms))
+            return StreamingResponse(
+                _stream_results(cursor, spec, limit, sort, count_task, guard, max_time_ms),
+                media_type="application/json"
+            )
+
+        # Get total count for pagination, concurrently with the page fetch
+        results, (total, total_capped) = await asyncio.gather(
+            cursor.to_list(length=limit),
+            count_total(db[collection], query, count, count_cap, max_time_ms)
+        )
+
+        next_cursor = encode_cursor(results[-1], spec) if results and len(results) == limit else None
+
+        response = {
             "results": [serialize_document(doc) for doc in results],
             "total": total,
-            "sort": sort
+            "total_capped": total_capped,
+            "sort": sort,
+            "next_cursor": next_cursor
         }
+        if guard["expensive"]:
+            response["warnings"] = _guard_warnings(guard)
+        return response
+    except HTTPException:
+        raise
+    except ExecutionTimeout:
+        raise HTTPException(
+            status_code=504,
+            detail={
+                "message": f"Query exceeded {max_time_ms} ms: {guard['reason']}",
+                "suggestions": guard["suggestions"]
+            }
+        )
     except PyMongoError as e:
         raise HTTPException(status_code=500, detail=f"MongoDB error: {str(e)}")
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": f"Exception: {str(e)}"})
 
+@db_router.post("/query/export", summary="Export query results as CSV, Parquet or Arrow")
+async def export_query(
+    collection: Literal["studies", "series", "instances"] = Body(..., description="Collection to export"),
+    query: dict = Body(default={}, description="MongoDB-style query"),
+    sort: dict = Body(default={}, description="Sort specification, as for /query"),
+    limit: Optional[int] = Body(default=None, description="Max rows to export (default: all matches)"),
+    fields: Optional[List[str]] = Body(default=None, description="Columns to export, e.g. ['id', 'modality', 'metadata.SliceThickness']"),
+    exclude_fields: Optional[List[str]] = Body(default=None, description="Promoted fields to leave out when fields is not given"),
+    metadata_keys: Optional[List[str]] = Body(default=None, description="Metadata keys added as metadata.<key> columns"),
+    format: Literal["csv", "parquet", "arrow"] = Body(default="csv", description="csv, parquet, or arrow (IPC stream)"),
+    db=Depends(get_db)
+):
+    """
+    Streams every match of `query` in one pass, straight from the cursor, as
+    CSV or as typed Parquet / Arrow record batches. Promoted fields are typed
+    from the model and metadata keys from the schema catalog.
+    """
+    if fields and exclude_fields:
+        raise HTTPException(status_code=400, detail="Use either fields or exclude_fields, not both")
+    for field in (fields or []) + [f"metadata.{key}" for key in metadata_keys or []]:
+        if not is_valid_path(field):
+            raise HTTPException(status_code=400, detail=f"Invalid export field: {field!r}")
+
+    try:
+        columns = resolve_columns(
+            MODEL_MAP[collection], await get_catalog(db, collection), fields, exclude_fields, metadata_keys
+        )
+    except PyMongoError as e:
+        raise HTTPException(status_code=500, detail=f"MongoDB error: {str(e)}")
+
+    cursor = db[collection].find(convert_object_ids(query), column_projection(columns))
+    cursor = cursor.sort(sort_spec(sort)).allow_disk_use(True)
+    if limit:
+        cursor = cursor.limit(limit)
+
+    if format == "csv":
+        body = stream_csv(cursor, columns)
+    else:
+        body = stream_arrow(cursor, columns, format)
+    return StreamingResponse(
+        body,
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{collection}.{format}"'}
+    )
+
+@db_router.post("/query/hierarchical", summary="Query one level with filters on studies, series and instances")
+async def run_hierarchical_query(
+    collection: Literal["studies", "series", "instances"] = Body(..., description="Level to return"),
+    filters: Dict[str, dict] = Body(default={}, description="MongoDB-style filter per level, e.g. {'studies': {...}, 'series': {...}}"),
+    limit: int = Body(default=100, description="Max results to return"),
+    sort: dict = Body(default={}, description="Sort specification on the returned level"),
+    after: Optional[str] = Body(default=None, description="next_cursor from the previous page"),
+    count: Literal["exact", "capped", "none"] = Body(default="capped", description="How to compute total: exact, capped at count_cap, or none"),
+    count_cap: int = Body(default=COUNT_CAP, description="Upper bound on total when count is 'capped'"),
+    fields: Optional[List[str]] = Body(default=None, description="Only return these fields"),
+    exclude_fields: Optional[List[str]] = Body(default=None, description="Return everything except these fields"),
+    db=Depends(get_db)
+):
+    """
+    Returns `collection` documents whose own filter matches, whose ancestors
+    match the ancestor filters and that have at least one descendant matching
+    each descendant filter, e.g. instances of CT series in studies from 2010.
+    Runs as one server-side plan: a semi-join from the most selective level,
+    or a $lookup pipeline when every filter is too broad for one.
+    """
+    unknown = set(filters) - set(LEVELS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Invalid filter levels: {', '.join(sorted(unknown))}")
+    filters = {level: convert_object_ids(query) for level, query in filters.items() if query}
+
+    spec = sort_spec(sort)
+    after_values = None
+    if after:
+        try:
+            after_values = decode_cursor(after, spec)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    projection = build_projection(fields, exclude_fields, spec)
+
+    max_time_ms = None
+    guard = query_guard.CHEAP
+    try:
+        target_query = filters.get(collection, {})
+        plan = {"strategy": "direct"}
+        if set(filters) - {collection}:
+            # Start from the level with the fewest matches
+            estimates = await estimate_levels(db, filters)
+            start = min(estimates, key=estimates.get)
+            plan = {"strategy": "semi_join", "start": start, "estimates": estimates}
+            if estimates[start] <= HIERARCHY_MAX_IDS:
+                semi_join = SemiJoinPlan(db, collection, filters, start)
+                try:
+                    await semi_join.resolve()
+                    target_query = semi_join.target_query()
+                except TooBroad as e:
+                    plan = {"strategy": "lookup", "estimates": estimates, "reason": f"{e} matched more than {HIERARCHY_MAX_IDS} documents"}
+            else:
+                plan = {"strategy": "lookup", "estimates": estimates, "reason": f"every filter matches more than {HIERARCHY_MAX_IDS} documents"}
+
+        page_query = target_query
+        if after_values is not None:
+            keyset = keyset_filter(spec, after_values)
+            page_query = {"$and": [target_query, keyset]} if target_query else keyset
+
+        if plan["strategy"] == "lookup":
+            # Per-document $lookups: time-box them like an expensive /query
+            if query_guard.QUERY_GUARD_MODE != "off":
+                max_time_ms = query_guard.QUERY_GUARD_MAX_TIME_MS
+            pipeline = [{"$match": page_query}, {"$sort": dict(spec)}] + lookup_stages(collection, filters)
+            pipeline.append({"$limit": limit})
+            if projection is None:
+                pipeline.append({"$unset": LOOKUP_FIELDS})
+            elif all(value == 1 for value in projection.values()):
+                pipeline.append({"$project": projection})
+            else:
+                pipeline.append({"$project": {**projection, **{field: 0 for field in LOOKUP_FIELDS}}})
+            options = {"maxTimeMS": max_time_ms} if max_time_ms else {}
+            results, (total, total_capped) = await asyncio.gather(
+                db[collection].aggregate(pipeline, **options).to_list(length=limit),
+                count_lookup(db, collection, target_query, filters, count, count_cap, max_time_ms)
+            )
+        else:
+            # Same cost guard as /query, on the target-level query
+            guard = await query_guard.assess_query(db, collection, page_query, spec, limit)
+            if guard["expensive"] and query_guard.QUERY_GUARD_MODE == "reject":
+                raise HTTPException(
+                    status_code=400,
+                    detail={"message": f"Query too expensive: {guard['reason']}", "suggestions": guard["suggestions"]}
+                )
+            if guard["expensive"] and query_guard.QUERY_GUARD_MODE == "limit":
+                max_time_ms = query_guard.QUERY_GUARD_MAX_TIME_MS
+            cursor = db[collection].find(page_query, projection).sort(spec).limit(limit)
+            if max_time_ms:
+                cursor = cursor.max_time_ms(max_time_ms)
+            results, (total, total_capped) = await asyncio.gather(
+                cursor.to_list(length=limit),
+                count_total(db[collection], target_query, count, count_cap, max_time_ms)
+            )
+
+        next_cursor = encode_cursor(results[-1], spec) if results and len(results) == limit else None
+        response = {
+            "results": [serialize_document(doc) for doc in results],
+            "total": total,
+            "total_capped": total_capped,
+            "sort": sort,
+            "next_cursor": next_cursor,
+            "plan": plan
+        }
+        if guard["expensive"]:
+            response["warnings"] = _guard_warnings(guard)
+        return response
+    except HTTPException:
+        raise
+    except ExecutionTimeout:
+        raise HTTPException(
+            status_code=504,
+            detail={
+                "message": f"Query exceeded {max_time_ms} ms" + (f": {guard['reason']}" if guard["expensive"] else ""),
+                "suggestions": guard["suggestions"] if guard["expensive"]
+                else ["Add a more selective filter at one of the levels, on an indexed field."]
+            }
+        )
+    except PyMongoError as e:
+        raise HTTPException(status_code=500, detail=f"MongoDB error: {str(e)}")
+
 @db_router.get('/available-fields')
 async def get_available_fields(
     collection: str = Query(..., description='Collection name'),
@@ -342,15 +1138,53 @@ async def get_available_metadata_fields(
 ):
     if collection not in MODEL_MAP:
         raise HTTPException(status_code=400, detail='Invalid collection name')
+    if collection_id and not ObjectId.is_valid(collection_id):
+        raise HTTPException(status_code=400, detail='Invalid collection ID')
+    try:
+        metadata_keys = await get_metadata_fields(db, collection, collection_id)
+    except PyMongoError as e:
+        raise HTTPException(status_code=500, detail=f"MongoDB error: {str(e)}")
+    return {"metadata_fields": metadata_keys}
+
+@db_router.get('/metadata-catalog')
+async def get_metadata_catalog(
+    collection: str = Query(..., description='Collection name'),
+    db=Depends(get_db)
+):
+    """
+    Metadata keys of a collection with their occurrence counts and observed value types.
+    """
+    if collection not in MODEL_MAP:
+        raise HTTPException(status_code=400, detail='Invalid collection name')
+    try:
+        entries = await get_catalog(db, collection)
+    except PyMongoError as e:
+        raise HTTPException(status_code=500, detail=f"MongoDB error: {str(e)}")
+    for entry in entries:
+        entry["collection_ids"] = [str(cid) for cid in entry.get("collection_ids", [])]
+    return {"metadata_fields": entries}
 
-    query = {}
-    if collection_id:
-        query['collection_id'] = collection_id
-    cursor = db[collection].find(query, {'metadata': 1})
-    metadata_keys = set()
-    async for doc in cursor:
-        metadata_keys.update(doc.get('metadata', {}).keys())
-        if len(metadata_keys) > 100:  # Limit to 100 unique keys for performance
-            break
-
-    return {"metadata_fields": list(metadata_keys)}
\ No newline at end of file
+@db_router.get('/facets')
+async def get_facet_counts(
+    collection: Literal["studies", "series"] = Query("studies", description='Collection name'),
+    facets: Optional[str] = Query(None, description='Comma-separated facet names (default: all facets of the collection)'),
+    limit: int = Query(50, ge=1, le=1000, description='Max values returned per facet'),
+    db=Depends(get_db)
+):
+    """
+    Document counts per value of the dashboard facets (modality, manufacturer,
+    body part, study year, slice thickness), read from the materialized facet
+    counts instead of the documents.
+    """
+    names = [name.strip() for name in facets.split(',') if name.strip()] if facets else None
+    unknown = [name for name in names or [] if name not in FACETS[collection]]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown facets for {collection}: {', '.join(unknown)}. Available: {', '.join(FACETS[collection])}"
+        )
+    try:
+        counts = await get_facets(db, collection, names, limit)
+    except PyMongoError as e:
+        raise HTTPException(status_code=500, detail=f"MongoDB error: {str(e)}")
+    return {"collection": collection, "facets": counts}
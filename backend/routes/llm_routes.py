@@ -1,29 +1,99 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from pydantic import BaseModel
+from pymongo.errors import PyMongoError, OperationFailure
+from typing import Dict, List, Optional
 from ..services.translation_layer.factory import get_llm_client
 from backend.services.translation_layer.utils.validators import validate_user_query, validate_mongo_query
 from backend.services.translation_layer.utils.parser import extract_json
+from backend.services.translation_layer.utils.schema_snapshot import schema_snapshot
+from backend.services.translation_layer.utils.translation_cache import translation_cache, is_cacheable
 from backend.services.db_service import get_db
+from backend.services.admission import llm_admission, AdmissionRejected
+from backend.services import query_guard
 
 llm_router = APIRouter()
 
 class LLMQueryRequest(BaseModel):
     user_query: str
+    # Used to share LLM capacity fairly between researchers
+    researcher_id: Optional[str] = None
 
 class LLMQueryResponse(BaseModel):
     mongo_query: dict
+    # Cost guard findings for queries that would scan a large collection
+    warnings: List[Dict] = []
+
+async def _check_cost(mongo_query: dict, db) -> List[dict]:
+    warnings = []
+    for collection, query in mongo_query.items():
+        if collection not in query_guard.PROMOTED_MODELS or not isinstance(query, dict):
+            continue
+        guard = await query_guard.assess_query(db, collection, query)
+        if not guard["expensive"]:
+            continue
+        if query_guard.QUERY_GUARD_MODE == "reject":
+            raise HTTPException(
+                status_code=400,
+                detail={"message": f"Generated query too expensive: {guard['reason']}", "suggestions": guard["suggestions"]}
+            )
+        warnings.append({"collection": collection, "reason": guard["reason"], "suggestions": guard["suggestions"]})
+    return warnings
 
 @llm_router.post("/llm/translate", response_model=LLMQueryResponse)
-async def translate_query(request: LLMQueryRequest, db=Depends(get_db)):
+async def translate_query(request: LLMQueryRequest, http_request: Request, db=Depends(get_db)):
     if not validate_user_query(request.user_query):
         raise HTTPException(status_code=400, detail="Invalid user query.")
-    llm_client = get_llm_client()
-    raw_result = await llm_client.translate(request.user_query)
-    if isinstance(raw_result, dict):
-        mongo_query = raw_result
+    client_key = request.researcher_id or (http_request.client.host if http_request.client else "anonymous")
+
+    # Only validated queries are returned, so only validated queries are cached.
+    # Cache hits never wait for an LLM slot.
+    async def translate():
+        llm_client = get_llm_client()
+        try:
+            async with llm_admission.slot(client_key):
+                # The fast path already ran (and was rejected) before the cache lookup
+                raw_result = await llm_client.translate_model(request.user_query)
+        except AdmissionRejected as e:
+            raise HTTPException(
+                status_code=e.status_code,
+                detail=e.detail,
+                headers={"Retry-After": str(e.retry_after)}
+            )
+        if isinstance(raw_result, dict):
+            mongo_query = raw_result
+        else:
+            mongo_query = extract_json(raw_result)
+        # Parse failures ({"error": ...}) and answers without a collection are
+        # not translations; raising here keeps them out of the cache
+        if not is_cacheable(mongo_query):
+            raise HTTPException(status_code=400, detail="Could not translate the query into a MongoDB query.")
+        is_valid = await validate_mongo_query(mongo_query, db)
+        if not is_valid:
+            raise HTTPException(status_code=400, detail="Invalid or unsafe MongoDB query generated.")
+        return mongo_query
+
+    # Simple questions are answered by the rule-based fast path, without
+    # touching the cache or the LLM queue
+    fast_query = await get_llm_client().translate_fast(request.user_query)
+    if fast_query is not None and await validate_mongo_query(fast_query, db):
+        mongo_query = fast_query
     else:
-        mongo_query = extract_json(raw_result)
-    is_valid = await validate_mongo_query(mongo_query, db)
-    if not is_valid:
-        raise HTTPException(status_code=400, detail="Invalid or unsafe MongoDB query generated.")
-    return {"mongo_query": mongo_query} 
\ No newline at end of file
+        snapshot = await schema_snapshot.get(db)
+        mongo_query = await translation_cache.get_or_translate(db, request.user_query, snapshot.version, translate)
+
+    # The plan depends on the current data and indexes, so cached translations are re-checked
+    try:
+        warnings = await _check_cost(mongo_query, db)
+    except OperationFailure as e:
+        raise HTTPException(status_code=400, detail=f"Generated query is not a valid filter: {str(e)}")
+    except PyMongoError as e:
+        raise HTTPException(status_code=500, detail=f"MongoDB error: {str(e)}")
+    return {"mongo_query": mongo_query, "warnings": warnings}
+
+@llm_router.get("/llm/cache/stats", summary="Translation cache hit rate and latency saved")
+async def translation_cache_stats():
+    return translation_cache.stats()
+
+@llm_router.get("/llm/admission/stats", summary="LLM concurrency limiter state and queue wait times")
+async def admission_stats():
+    return llm_admission.stats()
@@ -0,0 +1,160 @@
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Hashable
+
+# LLM admission defaults
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "2"))  # translations sent to Ollama at once
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "32"))  # requests waiting for a slot, all clients
+LLM_MAX_QUEUE_PER_CLIENT = int(os.getenv("LLM_MAX_QUEUE_PER_CLIENT", "4"))  # waiting requests per researcher
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))  # max seconds spent waiting for a slot
+
+# Number of recent queue waits kept for the percentiles in stats()
+WAIT_SAMPLES = 1000
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Bounded concurrency limiter with a fair waiting queue. At most
+    `max_in_flight` callers hold a slot; the rest wait in one FIFO per client
+    key, and freed slots go round-robin across keys so one researcher's burst
+    can't starve the others. When waiting would only end in a timeout, callers
+    are rejected right away with AdmissionRejected:
+    - 503 when the whole queue is full or the wait exceeded `queue_timeout`,
+    - 429 when this client already has `max_queue_per_client` requests waiting.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = LLM_MAX_IN_FLIGHT,
+        max_queue: int = LLM_MAX_QUEUE,
+        max_queue_per_client: int = LLM_MAX_QUEUE_PER_CLIENT,
+        queue_timeout: float = LLM_QUEUE_TIMEOUT,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.max_queue_per_client = max_queue_per_client
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.queued = 0
+        # client key -> waiters; key order is the round-robin order
+        self.waiters: "OrderedDict[Hashable, Deque[asyncio.Future]]" = OrderedDict()
+        # metrics
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {"queue_full": 0, "client_limit": 0, "timeout": 0}
+        self.waits: Deque[float] = deque(maxlen=WAIT_SAMPLES)
+        self.total_wait = 0.0
+        self.avg_service_seconds = None
+
+    def retry_after(self) -> int:
+        # Time for the current queue to drain, from the average slot hold time
+        service = self.avg_service_seconds or 1.0
+        return max(1, math.ceil(service * (self.queued / self.max_in_flight + 1)))
+
+    def _reject(self, reason: str, status_code: int, detail: str):
+        self.rejected[reason] += 1
+        raise AdmissionRejected(status_code, detail, self.retry_after())
+
+    def _record_wait(self, seconds: float) -> None:
+        self.admitted += 1
+        self.total_wait += seconds
+        self.waits.append(seconds)
+
+    async def acquire(self, key: Hashable) -> None:
+        if self.in_flight < self.max_in_flight and self.queued == 0:
+            self.in_flight += 1
+            self._record_wait(0.0)
+            return
+        if self.queued >= self.max_queue:
+            self._reject("queue_full", 503, "Translation service is saturated, retry later.")
+        queue = self.waiters.setdefault(key, deque())
+        if len(queue) >= self.max_queue_per_client:
+            self._reject("client_limit", 429, "Too many pending translations for this researcher.")
+
+        waiter = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        self.queued += 1
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done():
+                # The slot was handed over just as we gave up: pass it on
+                self.release()
+            else:
+                waiter.cancel()
+                self._remove(key, waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject("timeout", 503, "Timed out waiting for the translation service.")
+            raise
+        self._record_wait(time.perf_counter() - start)
+
+    def _remove(self, key: Hashable, waiter: asyncio.Future) -> None:
+        queue = self.waiters.get(key)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            self.queued -= 1
+            if not queue:
+                del self.waiters[key]
+
+    def release(self) -> None:
+        # Hand the slot to the next client in round-robin order, or free it
+        while self.waiters:
+            key, queue = next(iter(self.waiters.items()))
+            waiter = queue.popleft()
+            self.queued -= 1
+            if queue:
+                self.waiters.move_to_end(key)
+            else:
+                del self.waiters[key]
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self, key: Hashable):
+        await self.acquire(key)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            held = time.perf_counter() - start
+            self.avg_service_seconds = held if self.avg_service_seconds is None else 0.8 * self.avg_service_seconds + 0.2 * held
+            self.release()
+
+    def stats(self) -> dict:
+        waits = sorted(self.waits)
+
+        def percentile(p):
+            return waits[min(len(waits) - 1, int(p * len(waits)))] if waits else None
+
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "queue_wait_seconds": {
+                "avg": self.total_wait / self.admitted if self.admitted else None,
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "max": waits[-1] if waits else None,
+            },
+            "avg_service_seconds": self.avg_service_seconds,
+        }
+
+
+llm_admission = AdmissionController()
@@ -0,0 +1,57 @@
+import hashlib
+import os
+from typing import Optional, Tuple
+from bson import json_util
+from backend.services.cache import TTLCache
+
+# Seconds a total stays cached per (collection, normalized filter)
+COUNT_CACHE_TTL = float(os.getenv("COUNT_CACHE_TTL", "30"))
+# Default cap for count="capped"
+COUNT_CAP = 1000
+
+_count_cache = TTLCache(maxsize=1024, ttl=COUNT_CACHE_TTL)
+
+
+def normalize_filter(query: dict) -> str:
+    # Key order doesn't change a filter's meaning, so it doesn't change its cache key
+    return json_util.dumps(query, sort_keys=True)
+
+
+def filter_digest(query) -> str:
+    # Fixed-size cache key for a filter: semi-join filters carry $in lists of
+    # tens of thousands of ids, which would otherwise be kept as the key itself
+    return hashlib.sha256(normalize_filter(query).encode()).hexdigest()
+
+
+async def count_total(
+    collection, query: dict, mode: str = "exact", cap: int = COUNT_CAP, max_time_ms: Optional[int] = None
+) -> Tuple[Optional[int], bool]:
+    """
+    Returns (total, capped) for `query` on `collection`.
+
+    - mode "none" skips counting and returns (None, False).
+    - An empty filter uses estimated_document_count (collection metadata, no scan).
+    - mode "capped" stops counting after `cap` matches and returns (cap, True) when
+      there are more.
+    Totals are cached for COUNT_CACHE_TTL seconds, so paging through the same
+    filter doesn't recount it. `max_time_ms` bounds the count on the server.
+    """
+    if mode == "none":
+        return None, False
+
+    key = (collection.name, mode, cap if mode == "capped" else None, filter_digest(query))
+    cached = _count_cache.get(key)
+    if cached is not None:
+        return cached
+
+    options = {"maxTimeMS": max_time_ms} if max_time_ms else {}
+    if not query:
+        result = (await collection.estimated_document_count(), False)
+    elif mode == "capped":
+        total = await collection.count_documents(query, limit=cap + 1, **options)
+        result = (cap, True) if total > cap else (total, False)
+    else:
+        result = (await collection.count_documents(query, **options), False)
+
+    _count_cache.set(key, result)
+    return result
@@ -0,0 +1,41 @@
+from datetime import date
+from typing import Any, Iterable, Set
+from bson import ObjectId
+
+# Dotted field paths and JSON encoding of Mongo documents, shared by /query
+# (projections, cursors, streamed responses), /query/export and the facets, so
+# they all accept the same paths and encode values the same way.
+
+
+def get_path(doc: dict, path: str) -> Any:
+    # Value at a dotted path; None when a part is missing or not a document
+    value = doc
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def is_valid_path(path: str) -> bool:
+    # No empty parts and no $-prefixed parts, which Mongo would read as operators
+    return all(part and not part.startswith("$") for part in path.split("."))
+
+
+def prune_paths(paths: Iterable[str]) -> Set[str]:
+    # Mongo rejects a path together with one of its parents ("path collision"),
+    # so only the parent is kept
+    paths = set(paths)
+    return {p for p in paths if not any(p.startswith(other + ".") for other in paths)}
+
+
+def json_default(value):
+    # BSON values the json module can't encode, encoded like FastAPI encodes
+    # them in buffered responses
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.decode(errors="replace")
+    return str(value)
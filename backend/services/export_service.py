@@ -0,0 +1,230 @@
+import csv
+import io
+import json
+import logging
+import os
+import typing
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, NamedTuple, Optional
+from bson import ObjectId
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pymongo.errors import PyMongoError
+from backend.services.document_paths import get_path, json_default, prune_paths
+
+logger = logging.getLogger(__name__)
+
+# Rows per CSV chunk / Arrow record batch (one Parquet row group each). Memory
+# use is bounded by one batch, whatever the size of the export.
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "10000"))
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+
+class ExportColumn(NamedTuple):
+    name: str  # column header, e.g. "id" or "metadata.Modality"
+    path: str  # document path, e.g. "_id"
+    type: str  # "int", "float", "bool", "string" or "json"
+
+
+def _annotation_type(annotation) -> str:
+    args = [a for a in typing.get_args(annotation) if a is not type(None)]
+    if typing.get_origin(annotation) is typing.Union and args:
+        annotation = args[0]
+    if annotation is bool:
+        return "bool"
+    if annotation is int:
+        return "int"
+    if annotation is float:
+        return "float"
+    if annotation is str or (isinstance(annotation, type) and issubclass(annotation, ObjectId)):
+        return "string"
+    return "json"
+
+
+def _catalog_type(types: Dict[str, int]) -> str:
+    # Column type for a metadata key from the value types the catalog has seen
+    seen = {t for t, n in (types or {}).items() if n and t != "null"}
+    if not seen or seen == {"string"}:
+        return "string"
+    if seen <= {"int", "long"}:
+        return "int"
+    if seen <= {"int", "long", "double"}:
+        return "float"
+    if seen == {"bool"}:
+        return "bool"
+    return "json"
+
+
+def resolve_columns(
+    model,
+    catalog: List[dict],
+    fields: Optional[List[str]] = None,
+    exclude_fields: Optional[List[str]] = None,
+    metadata_keys: Optional[List[str]] = None,
+) -> List[ExportColumn]:
+    """
+    Export columns: `fields` in order, or every promoted field of `model`
+    except `exclude_fields` and the metadata dict, followed by the requested
+    metadata keys. Promoted fields are typed from the model, metadata keys
+    from the types recorded in the schema catalog.
+    """
+    metadata_types = {entry["key"]: _catalog_type(entry.get("types")) for entry in catalog}
+    names = list(fields) if fields else [
+        name for name in model.model_fields if name != "metadata" and name not in (exclude_fields or [])
+    ]
+    names += [f"metadata.{key}" for key in metadata_keys or [] if f"metadata.{key}" not in names]
+
+    columns = []
+    for name in names:
+        if name == "id":
+            columns.append(ExportColumn("id", "_id", "string"))
+        elif name.startswith("metadata."):
+            columns.append(ExportColumn(name, name, metadata_types.get(name[len("metadata."):], "string")))
+        elif name in model.model_fields:
+            columns.append(ExportColumn(name, name, _annotation_type(model.model_fields[name].annotation)))
+        else:
+            columns.append(ExportColumn(name, name, "json"))
+    return columns
+
+
+def column_projection(columns: List[ExportColumn]) -> dict:
+    projection = {path: 1 for path in prune_paths(column.path for column in columns)}
+    if "_id" not in projection:
+        projection["_id"] = 0
+    return projection
+
+
+def _to_text(value) -> str:
+    # CSV cell: scalars as-is, nested values as JSON
+    if value is None:
+        return ""
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, default=json_default, separators=(",", ":"))
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def _coerce(value, column_type: str):
+    # Arrow cell: values that don't fit the column type become null
+    if value is None:
+        return None
+    if column_type == "string":
+        return value.isoformat() if isinstance(value, datetime) else str(value)
+    if column_type == "json":
+        return json.dumps(value, default=json_default, separators=(",", ":"))
+    if column_type == "bool":
+        return value if isinstance(value, bool) else None
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    if column_type == "int":
+        return int(value) if float(value).is_integer() else None
+    return float(value)
+
+
+async def stream_csv(cursor, columns: List[ExportColumn], batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([column.name for column in columns])
+    rows = 0
+    try:
+        async for doc in cursor:
+            writer.writerow([_to_text(get_path(doc, column.path)) for column in columns])
+            rows += 1
+            if rows % batch_size == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    except PyMongoError:
+        # Headers are already sent, so the truncated body is the only signal left
+        logger.exception("MongoDB error while exporting CSV after %d rows", rows)
+
+
+class _ChunkSink:
+    """
+    Write-only file object that keeps what Arrow writes until drained. tell()
+    counts every byte ever written, which the Parquet footer offsets rely on.
+    """
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def writable(self) -> bool:
+        return True
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+ARROW_TYPES = {
+    "int": lambda: pa.int64(),
+    "float": lambda: pa.float64(),
+    "bool": lambda: pa.bool_(),
+    "string": lambda: pa.string(),
+    "json": lambda: pa.string(),
+}
+
+
+async def stream_arrow(
+    cursor, columns: List[ExportColumn], file_format: str = "parquet", batch_size: int = EXPORT_BATCH_SIZE
+) -> AsyncIterator[bytes]:
+    """
+    Streams the cursor as Parquet (one row group per batch) or as an Arrow IPC
+    stream of record batches, yielding the encoded bytes batch by batch.
+    """
+    schema = pa.schema([(column.name, ARROW_TYPES[column.type]()) for column in columns])
+    sink = _ChunkSink()
+    out = pa.PythonFile(sink, mode="w")
+    if file_format == "parquet":
+        writer = pq.ParquetWriter(out, schema)
+    else:
+        writer = pa.ipc.new_stream(out, schema)
+
+    def write(values):
+        writer.write_batch(pa.record_batch(
+            [pa.array(column_values, type=field.type) for column_values, field in zip(values, schema)],
+            schema=schema
+        ))
+
+    values = [[] for _ in columns]
+    rows = 0
+    try:
+        async for doc in cursor:
+            for column, column_values in zip(columns, values):
+                column_values.append(_coerce(get_path(doc, column.path), column.type))
+            rows += 1
+            if rows % batch_size == 0:
+                write(values)
+                values = [[] for _ in columns]
+                yield sink.drain()
+        if rows % batch_size or rows == 0:
+            write(values)
+        writer.close()
+        yield sink.drain()
+    except PyMongoError:
+        logger.exception("MongoDB error while exporting %s after %d rows", file_format, rows)
@@ -0,0 +1,198 @@
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+from backend.services.document_paths import get_path
+
+logger = logging.getLogger(__name__)
+
+# Materialized facet counts for the dashboard: one document per
+# (collection, facet, value) with the number of documents having that value.
+# Ingest increments the counts of new documents; a periodic $merge rebuild
+# recomputes them from the documents, which also corrects drift from updates
+# and deletes that ingest doesn't track. The triple is also the _id, so the
+# rebuild can $merge on it even when the value is null (field not set).
+# built_at is the last time ingest or a rebuild wrote the count.
+FACET_COLLECTION = "facet_counts"
+# Seconds between full rebuilds
+FACET_REBUILD_INTERVAL = float(os.getenv("FACET_REBUILD_INTERVAL", "3600"))
+# Seconds between rebuilds of collections whose documents were updated in place
+FACET_STALE_INTERVAL = float(os.getenv("FACET_STALE_INTERVAL", "300"))
+
+# collection -> facet -> (document path, transform). The "year" transform
+# keeps the first four characters of a YYYYMMDD date string.
+FACETS = {
+    "studies": {
+        "modality": ("modality", None),
+        "study_year": ("study_date", "year"),
+    },
+    "series": {
+        "modality": ("metadata.Modality", None),
+        "manufacturer": ("manufacturer", None),
+        "body_part_examined": ("body_part_examined", None),
+        "slice_thickness": ("slice_thickness", None),
+    },
+}
+
+
+# Collections with documents updated in place (upsert ingest), whose counts
+# ingest can't adjust; rebuilt ahead of the next full rebuild
+_stale = set()
+
+
+def mark_facets_stale(collection: str) -> None:
+    if collection in FACETS:
+        _stale.add(collection)
+
+
+def _facet_value(doc: dict, path: str, transform: Optional[str]):
+    value = get_path(doc, path)
+    if transform == "year":
+        return value[:4] if isinstance(value, str) and len(value) >= 4 else None
+    return value
+
+
+def _facet_id(collection: str, facet: str, value) -> dict:
+    return {"collection": collection, "facet": facet, "value": value}
+
+
+def _facet_expression(path: str, transform: Optional[str]):
+    # Aggregation equivalent of _facet_value, used by the rebuild
+    if transform == "year":
+        date = {"$ifNull": [f"${path}", ""]}
+        return {"$cond": [{"$gte": [{"$strLenCP": date}, 4]}, {"$substrCP": [date, 0, 4]}, None]}
+    return {"$ifNull": [f"${path}", None]}
+
+
+async def record_facets(db, collection: str, docs: Iterable[dict]) -> None:
+    """
+    Adds newly created documents to the facet counts with a single bulk_write.
+    Failures are logged, never raised: the documents are already written and
+    the next rebuild restores the counts.
+    """
+    facets = FACETS.get(collection)
+    if not facets:
+        return
+    counts = Counter()
+    for doc in docs:
+        for facet, (path, transform) in facets.items():
+            counts[(facet, _facet_value(doc, path, transform))] += 1
+    if not counts:
+        return
+
+    now = datetime.now(timezone.utc)
+    ops = [
+        UpdateOne(
+            {"_id": _facet_id(collection, facet, value)},
+            {
+                "$inc": {"count": n},
+                "$set": {"built_at": now},
+                "$setOnInsert": {"collection": collection, "facet": facet, "value": value},
+            },
+            upsert=True
+        )
+        for (facet, value), n in counts.items()
+    ]
+    try:
+        await db[FACET_COLLECTION].bulk_write(ops, ordered=False)
+    except PyMongoError:
+        logger.exception("Failed to update the facet counts for %s", collection)
+
+
+async def get_facets(db, collection: str, facets: Optional[List[str]] = None, limit: int = 50) -> Dict[str, List[dict]]:
+    """
+    Returns {facet: [{"value", "count"}, ...]} for `collection`, most frequent
+    values first, from an index scan over the materialized counts.
+    """
+    names = facets or list(FACETS[collection])
+    query = {"collection": collection, "facet": {"$in": names}, "count": {"$gt": 0}}
+    cursor = db[FACET_COLLECTION].find(query, {"_id": 0, "facet": 1, "value": 1, "count": 1}).sort(
+        [("collection", 1), ("facet", 1), ("count", -1)]
+    )
+    result = {name: [] for name in names}
+    async for doc in cursor:
+        values = result[doc["facet"]]
+        if len(values) < limit:
+            values.append({"value": doc["value"], "count": doc["count"]})
+    return result
+
+
+async def rebuild_facets(db, collection: str) -> int:
+    """
+    Recomputes the facet counts of `collection` with one aggregation that
+    $merges into the facet collection, then drops values no document has
+    anymore. Returns the number of facet values written.
+
+    Counts ingest wrote while the rebuild ran carry a newer built_at: the
+    $merge keeps them (and their increments) over the recomputed value, and
+    the collection is marked stale so the next stale rebuild recounts them.
+    """
+    facets = FACETS[collection]
+    started = datetime.now(timezone.utc)
+    pipeline = [
+        {"$project": {"_id": 0, "pairs": [
+            {"facet": facet, "value": _facet_expression(path, transform)}
+            for facet, (path, transform) in facets.items()
+        ]}},
+        {"$unwind": "$pairs"},
+        {"$group": {"_id": {"facet": "$pairs.facet", "value": "$pairs.value"}, "count": {"$sum": 1}}},
+        {"$project": {
+            "_id": {"collection": {"$literal": collection}, "facet": "$_id.facet", "value": "$_id.value"},
+            "collection": {"$literal": collection},
+            "facet": "$_id.facet",
+            "value": "$_id.value",
+            "count": 1,
+            "built_at": {"$literal": started},
+        }},
+        {"$merge": {
+            "into": FACET_COLLECTION,
+            "on": "_id",
+            "whenMatched": [{"$replaceWith": {
+                "$cond": [{"$gt": [{"$ifNull": ["$built_at", None]}, "$$new.built_at"]}, "$$ROOT", "$$new"]
+            }}],
+            "whenNotMatched": "insert",
+        }},
+    ]
+    await db[collection].aggregate(pipeline, allowDiskUse=True).to_list(length=None)
+    await db[FACET_COLLECTION].delete_many({"collection": collection, "built_at": {"$not": {"$gte": started}}})
+    if await db[FACET_COLLECTION].count_documents({"collection": collection, "built_at": {"$gt": started}}, limit=1):
+        mark_facets_stale(collection)
+    return await db[FACET_COLLECTION].count_documents({"collection": collection})
+
+
+async def rebuild_all_facets(db) -> Dict[str, int]:
+    return {collection: await rebuild_facets(db, collection) for collection in FACETS}
+
+
+async def run_facet_rebuilds(
+    db, interval: float = FACET_REBUILD_INTERVAL, stale_interval: float = FACET_STALE_INTERVAL
+) -> None:
+    # Background loop, started from the app lifespan. Every collection is
+    # rebuilt each `interval`, stale ones each `stale_interval`. An empty facet
+    # collection (new deployment, or data ingested before facets existed) is
+    # built right away.
+    try:
+        empty = await db[FACET_COLLECTION].estimated_document_count() == 0
+    except PyMongoError:
+        logger.exception("Could not read the facet counts")
+        empty = True
+    last_full = None if empty else time.monotonic()
+    while True:
+        full = last_full is None or time.monotonic() - last_full >= interval
+        collections = list(FACETS) if full else [c for c in FACETS if c in _stale]
+        _stale.difference_update(collections)
+        try:
+            counts = {collection: await rebuild_facets(db, collection) for collection in collections}
+            if counts:
+                logger.info("Facet counts rebuilt: %s", counts)
+            if full:
+                last_full = time.monotonic()
+        except PyMongoError:
+            logger.exception("Facet rebuild failed")
+            _stale.update(collections)
+        await asyncio.sleep(stale_interval)
@@ -0,0 +1,190 @@
+import asyncio
+import os
+from typing import Dict, List, Optional
+
+# Cross-level queries: filters on studies, series and instances, results at one
+# of those levels. Two plans:
+# - semi-join: resolve the ids of the most selective filtered level, then walk
+#   the study -> series -> instance links outward from it, one indexed $in
+#   query per level, so the target level is filtered by a bounded id list;
+# - $lookup: when every filter matches more than HIERARCHY_MAX_IDS documents,
+#   scan the target level in sort order and check its ancestors/descendants per
+#   document with indexed $lookup sub-pipelines until the page is full.
+
+LEVELS = ("studies", "series", "instances")
+# Field of each level that references its parent level
+PARENT_KEYS = {"series": "study_id", "instances": "series_id"}
+# Max ids a semi-join step may carry to the next level
+HIERARCHY_MAX_IDS = int(os.getenv("HIERARCHY_MAX_IDS", "50000"))
+# Temporary fields added by the $lookup plan
+LOOKUP_FIELDS = ["_up", "_down"]
+
+
+class TooBroad(Exception):
+    # A semi-join step matched more than HIERARCHY_MAX_IDS documents
+    pass
+
+
+def _and(*queries: Optional[dict]) -> dict:
+    queries = [q for q in queries if q]
+    if not queries:
+        return {}
+    return queries[0] if len(queries) == 1 else {"$and": queries}
+
+
+async def estimate_levels(db, filters: Dict[str, dict], cap: int = HIERARCHY_MAX_IDS) -> Dict[str, int]:
+    """
+    Number of matches of each level's filter, counted up to cap + 1, so an
+    unselective filter costs at most cap + 1 index entries.
+    """
+    levels = [level for level in LEVELS if filters.get(level)]
+    counts = await asyncio.gather(
+        *(db[level].count_documents(filters[level], limit=cap + 1) for level in levels)
+    )
+    return dict(zip(levels, counts))
+
+
+class SemiJoinPlan:
+    """
+    Resolves the id sets of every level between the filtered levels and the
+    target (each a {_id: parent_id} map), starting at `start` and pruning the
+    sets as each level is added, so all of them stay consistent with every
+    filter. target_query() then returns the filter for the target level.
+    """
+
+    def __init__(self, db, target: str, filters: Dict[str, dict], start: str, cap: int = HIERARCHY_MAX_IDS):
+        self.db = db
+        self.target = LEVELS.index(target)
+        self.filters = {LEVELS.index(level): query for level, query in filters.items() if query}
+        self.start = LEVELS.index(start)
+        self.cap = cap
+        self.ids: Dict[int, dict] = {}
+
+        span = set(self.filters) | {self.target}
+        lo, hi = min(span), max(span)
+        # The target is the final (paginated) query, so it's only resolved
+        # when other levels depend on it from both sides, or it's the start
+        if self.target == lo and self.start != lo:
+            lo += 1
+        if self.target == hi and self.start != hi:
+            hi -= 1
+        self.lo, self.hi = lo, hi
+
+    async def _fetch(self, level: int, query: dict) -> dict:
+        name = LEVELS[level]
+        parent_key = PARENT_KEYS.get(name)
+        projection = {"_id": 1, parent_key: 1} if parent_key else {"_id": 1}
+        docs = await self.db[name].find(query, projection).limit(self.cap + 1).to_list(length=self.cap + 1)
+        if len(docs) > self.cap:
+            raise TooBroad(name)
+        return {doc["_id"]: doc.get(parent_key) for doc in docs}
+
+    def _prune(self) -> None:
+        # Keep only ids that have a matching parent and (for levels below the
+        # resolved ones) a matching child: one pass down, one pass up
+        levels = sorted(self.ids)
+        for level in levels[1:]:
+            parents = self.ids[level - 1]
+            self.ids[level] = {k: v for k, v in self.ids[level].items() if v in parents}
+        for level in reversed(levels[:-1]):
+            children = set(self.ids[level + 1].values())
+            self.ids[level] = {k: v for k, v in self.ids[level].items() if k in children}
+
+    async def resolve(self) -> None:
+        self.ids[self.start] = await self._fetch(self.start, self.filters.get(self.start, {}))
+        # Up: parents of the resolved ids that match their own filter
+        for level in range(self.start - 1, self.lo - 1, -1):
+            parent_ids = list(set(self.ids[level + 1].values()))
+            self.ids[level] = await self._fetch(level, _and(self.filters.get(level), {"_id": {"$in": parent_ids}}))
+            self._prune()
+        # Down: children of the resolved ids that match their own filter
+        for level in range(self.start + 1, self.hi + 1):
+            parent_key = PARENT_KEYS[LEVELS[level]]
+            query = _and(self.filters.get(level), {parent_key: {"$in": list(self.ids[level - 1])}})
+            if level == self.hi and level > self.target:
+                # Only the existence of a child matters here: keep the parents that have one
+                with_child = set(await self.db[LEVELS[level]].distinct(parent_key, query))
+                self.ids[level - 1] = {k: v for k, v in self.ids[level - 1].items() if k in with_child}
+            else:
+                self.ids[level] = await self._fetch(level, query)
+            self._prune()
+
+    def target_query(self) -> dict:
+        if self.target in self.ids:
+            return {"_id": {"$in": list(self.ids[self.target])}}
+        parts = [self.filters.get(self.target)]
+        if self.target - 1 in self.ids:
+            parent_key = PARENT_KEYS[LEVELS[self.target]]
+            parts.append({parent_key: {"$in": list(self.ids[self.target - 1])}})
+        if self.target + 1 in self.ids:
+            parts.append({"_id": {"$in": list(set(self.ids[self.target + 1].values()))}})
+        return _and(*parts)
+
+
+def _ancestor_stages(level: int, top: int, filters: Dict[str, dict]) -> List[dict]:
+    # Keeps `level` documents whose ancestors up to `top` match their filters
+    if level <= top:
+        return []
+    parent = level - 1
+    sub = ([{"$match": filters[LEVELS[parent]]}] if filters.get(LEVELS[parent]) else [])
+    sub += _ancestor_stages(parent, top, filters) + [{"$project": {"_id": 1}}]
+    return [
+        {"$lookup": {
+            "from": LEVELS[parent],
+            "localField": PARENT_KEYS[LEVELS[level]],
+            "foreignField": "_id",
+            "pipeline": sub,
+            "as": "_up",
+        }},
+        {"$match": {"_up": {"$ne": []}}},
+    ]
+
+
+def _descendant_stages(level: int, bottom: int, filters: Dict[str, dict]) -> List[dict]:
+    # Keeps `level` documents with at least one matching descendant down to `bottom`
+    if level >= bottom:
+        return []
+    child = level + 1
+    sub = ([{"$match": filters[LEVELS[child]]}] if filters.get(LEVELS[child]) else [])
+    sub += _descendant_stages(child, bottom, filters) + [{"$limit": 1}, {"$project": {"_id": 1}}]
+    return [
+        {"$lookup": {
+            "from": LEVELS[child],
+            "localField": "_id",
+            "foreignField": PARENT_KEYS[LEVELS[child]],
+            "pipeline": sub,
+            "as": "_down",
+        }},
+        {"$match": {"_down": {"$ne": []}}},
+    ]
+
+
+def lookup_stages(target: str, filters: Dict[str, dict]) -> List[dict]:
+    """
+    $lookup stages that keep target documents whose ancestors match the
+    ancestor filters and that have a descendant matching the descendant
+    filters. The target's own filter is not included.
+    """
+    level = LEVELS.index(target)
+    filtered = [LEVELS.index(name) for name, query in filters.items() if query]
+    top = min(filtered + [level])
+    bottom = max(filtered + [level])
+    return _ancestor_stages(level, top, filters) + _descendant_stages(level, bottom, filters)
+
+
+async def count_lookup(db, target: str, query: dict, filters: Dict[str, dict], mode: str, cap: int, max_time_ms: Optional[int] = None):
+    """
+    (total, capped) for the $lookup plan, with the same modes as count_total.
+    """
+    if mode == "none":
+        return None, False
+    pipeline = [{"$match": query}] + lookup_stages(target, filters)
+    if mode == "capped":
+        pipeline.append({"$limit": cap + 1})
+    pipeline.append({"$count": "n"})
+    options = {"maxTimeMS": max_time_ms} if max_time_ms else {}
+    docs = await db[target].aggregate(pipeline, **options).to_list(length=1)
+    total = docs[0]["n"] if docs else 0
+    if mode == "capped" and total > cap:
+        return cap, True
+    return total, False
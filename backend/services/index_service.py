@@ -0,0 +1,85 @@
+import logging
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Declarative index registry: collection -> indexes on the promoted fields and
+# UIDs. Every index is named, so applying the registry is idempotent and an
+# index can be changed by renaming it here. Sort-oriented indexes end with _id,
+# the tie-breaker /query appends to every sort, so keyset pages are index seeks.
+INDEXES = {
+    "studies": [
+        IndexModel([("study_instance_uid", ASCENDING)], name="study_instance_uid_unique", unique=True),
+        IndexModel([("patient_id", ASCENDING), ("study_date", DESCENDING), ("_id", DESCENDING)], name="patient_id_study_date_id"),
+        IndexModel([("modality", ASCENDING), ("study_date", DESCENDING), ("_id", DESCENDING)], name="modality_study_date_id"),
+        IndexModel([("study_date", DESCENDING), ("_id", DESCENDING)], name="study_date_id"),
+        IndexModel([("accession_number", ASCENDING)], name="accession_number"),
+    ],
+    "series": [
+        IndexModel([("series_instance_uid", ASCENDING)], name="series_instance_uid_unique", unique=True),
+        IndexModel([("study_id", ASCENDING), ("series_number", ASCENDING), ("_id", ASCENDING)], name="study_id_series_number_id"),
+        IndexModel([("body_part_examined", ASCENDING), ("series_date", DESCENDING), ("_id", DESCENDING)], name="body_part_examined_series_date_id"),
+        IndexModel([("manufacturer", ASCENDING), ("manufacturer_model_name", ASCENDING)], name="manufacturer_model"),
+        IndexModel([("slice_thickness", ASCENDING)], name="slice_thickness"),
+    ],
+    "instances": [
+        IndexModel([("sop_instance_uid", ASCENDING)], name="sop_instance_uid_unique", unique=True),
+        IndexModel([("series_id", ASCENDING), ("instance_number", ASCENDING), ("_id", ASCENDING)], name="series_id_instance_number_id"),
+    ],
+    "schema_catalog": [
+        IndexModel([("collection", ASCENDING), ("key", ASCENDING)], name="collection_key_unique", unique=True),
+        IndexModel([("collection", ASCENDING), ("collection_ids", ASCENDING), ("key", ASCENDING)], name="collection_collection_ids_key"),
+    ],
+    "facet_counts": [
+        IndexModel([("collection", ASCENDING), ("facet", ASCENDING), ("count", DESCENDING)], name="collection_facet_count"),
+    ],
+    "translation_cache": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+}
+
+
+async def ensure_indexes(db) -> None:
+    """
+    Creates every index in the registry that doesn't exist yet. Indexes are
+    created one at a time, so one failure (e.g. a unique index over existing
+    duplicates) is logged without blocking the others or the app startup.
+    """
+    for collection, indexes in INDEXES.items():
+        for index in indexes:
+            try:
+                await db[collection].create_indexes([index])
+            except OperationFailure as e:
+                logger.warning(
+                    "Could not create index %s on %s: %s",
+                    index.document["name"], collection, e.details.get("errmsg", str(e))
+                )
+
+
+async def has_unique_index(db, collection: str, field: str) -> bool:
+    # True if `collection` has a unique index on exactly `field`
+    indexes = await db[collection].index_information()
+    return any(
+        info.get("unique") and [key for key, _ in info["key"]] == [field]
+        for info in indexes.values()
+    )
+
+
+async def get_index_stats(db) -> dict:
+    """
+    Returns per-index usage counters from $indexStats for every registered collection.
+    """
+    stats = {}
+    for collection in INDEXES:
+        cursor = db[collection].aggregate([{"$indexStats": {}}])
+        stats[collection] = [
+            {
+                "name": doc["name"],
+                "key": dict(doc["key"]),
+                "ops": doc["accesses"]["ops"],
+                "since": doc["accesses"]["since"],
+            }
+            async for doc in cursor
+        ]
+    return stats
@@ -0,0 +1,148 @@
+import logging
+from typing import Iterable
+from pymongo import UpdateOne
+from backend.services.facet_service import mark_facets_stale
+from backend.services.index_service import ensure_indexes, has_unique_index
+from backend.services.parent_cache import parent_cache
+from backend.services.schema_catalog import mark_catalog_stale
+
+logger = logging.getLogger(__name__)
+
+# Series whose summary is rebuilt per round trip
+MIGRATION_BATCH_SIZE = 500
+
+# Levels deduplicated on their UID, parents first: (collection, UID field,
+# child collection, child field linking to it, array fields merged into the
+# document that is kept)
+UID_LEVELS = (
+    ("studies", "study_instance_uid", "series", "study_id", ("collection_ids", "series")),
+    ("series", "series_instance_uid", "instances", "series_id", ("collection_ids",)),
+    ("instances", "sop_instance_uid", None, None, ("collection_ids",)),
+)
+
+
+async def _recount_series(db, ids: list) -> None:
+    # Recomputes the instance summary of the given series from their instances
+    summaries = {
+        doc["_id"]: doc
+        async for doc in db["instances"].aggregate([
+            {"$match": {"series_id": {"$in": ids}}},
+            {"$group": {
+                "_id": "$series_id",
+                "count": {"$sum": 1},
+                "min": {"$min": "$instance_number"},
+                "max": {"$max": "$instance_number"},
+            }},
+        ])
+    }
+    ops = []
+    for series_id in ids:
+        summary = summaries.get(series_id, {})
+        ops.append(UpdateOne(
+            {"_id": series_id},
+            {
+                "$set": {
+                    "instance_count": summary.get("count", 0),
+                    "min_instance_number": summary.get("min"),
+                    "max_instance_number": summary.get("max"),
+                },
+                "$unset": {"instances": ""},
+            }
+        ))
+    if ops:
+        await db["series"].bulk_write(ops, ordered=False)
+
+
+async def migrate_series_instance_links(db, batch_size: int = MIGRATION_BATCH_SIZE, recount_all: bool = False) -> dict:
+    """
+    Replaces the legacy series.instances id arrays with the instance summary
+    fields (instance_count, min/max_instance_number), computed from the
+    instances collection through its series_id index.
+
+    Only series that still carry an `instances` array are touched, so the
+    migration is idempotent and can be resumed after an interruption.
+    With `recount_all`, every series' summary is recomputed instead.
+    """
+    query = {} if recount_all else {"instances": {"$exists": True}}
+    migrated = 0
+    last_id = None
+    while True:
+        # Walk series in _id order, one batch at a time
+        page_query = dict(query)
+        if last_id is not None:
+            page_query["_id"] = {"$gt": last_id}
+        batch = await db["series"].find(page_query, {"_id": 1}).sort("_id", 1).limit(batch_size).to_list(length=batch_size)
+        if not batch:
+            break
+        ids = [doc["_id"] for doc in batch]
+        last_id = ids[-1]
+        await _recount_series(db, ids)
+        migrated += len(ids)
+        logger.info("Migrated instance links of %d series", migrated)
+
+    return {"migrated_series": migrated}
+
+
+async def _merge_duplicates(db, collection: str, keep, others: list, child, parent_key, merged: Iterable[str]) -> set:
+    # Folds `others` into `keep`: merges their link arrays, re-points their
+    # children, deletes them. Returns the series whose instances changed.
+    projection = {field: 1 for field in merged}
+    if collection == "instances":
+        projection["series_id"] = 1
+    docs = await db[collection].find({"_id": {"$in": others}}, projection).to_list(length=None)
+    union = {field: [value for doc in docs for value in doc.get(field) or []] for field in merged}
+    union = {field: values for field, values in union.items() if values}
+    if union:
+        await db[collection].update_one(
+            {"_id": keep}, {"$addToSet": {field: {"$each": values} for field, values in union.items()}}
+        )
+    if child:
+        await db[child].update_many({parent_key: {"$in": others}}, {"$set": {parent_key: keep}})
+    await db[collection].delete_many({"_id": {"$in": others}})
+    if collection == "series":
+        return {keep}
+    if collection == "instances":
+        return {doc["series_id"] for doc in docs if doc.get("series_id") is not None}
+    return set()
+
+
+async def dedupe_uids(db) -> dict:
+    """
+    Removes documents that share a UID with an older one, so the unique UID
+    indexes upsert ingest relies on can be built (re-runs before upserts
+    existed inserted the same file more than once). Per duplicated UID the
+    oldest document (smallest _id) is kept: the others' collection links are
+    merged into it, their children re-pointed to it, and they are deleted.
+    Affected series summaries are recounted, then the indexes are applied.
+
+    Idempotent: with no duplicates left, it only re-checks the indexes.
+    """
+    removed = {}
+    recount = set()
+    for collection, key, child, parent_key, merged in UID_LEVELS:
+        pipeline = [
+            {"$group": {"_id": f"${key}", "ids": {"$push": "$_id"}, "n": {"$sum": 1}}},
+            {"$match": {"n": {"$gt": 1}, "_id": {"$ne": None}}},
+        ]
+        removed[collection] = 0
+        async for group in db[collection].aggregate(pipeline, allowDiskUse=True):
+            keep, *others = sorted(group["ids"])
+            recount |= await _merge_duplicates(db, collection, keep, others, child, parent_key, merged)
+            parent_cache.invalidate(collection, others)
+            removed[collection] += len(others)
+        if removed[collection]:
+            logger.info("Removed %d %s sharing a %s", removed[collection], collection, key)
+            mark_catalog_stale(collection)
+            mark_facets_stale(collection)
+
+    recount = list(recount)
+    for start in range(0, len(recount), MIGRATION_BATCH_SIZE):
+        await _recount_series(db, recount[start:start + MIGRATION_BATCH_SIZE])
+
+    await ensure_indexes(db)
+    return {
+        "removed": removed,
+        "unique_indexes": {
+            collection: await has_unique_index(db, collection, key) for collection, key, *_ in UID_LEVELS
+        },
+    }
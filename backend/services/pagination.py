@@ -0,0 +1,74 @@
+import base64
+import binascii
+import json
+from typing import Any, Dict, List, Tuple
+from bson import json_util
+from backend.services.document_paths import get_path
+
+# Keyset (cursor) pagination for /query. A cursor encodes the sort spec and the
+# sort-key values of the last document of a page (with _id as the final
+# tie-breaker), so the next page is an index seek past that document instead of
+# skipping over everything before it.
+
+SortSpec = List[Tuple[str, int]]
+
+
+def sort_spec(sort: Dict[str, int]) -> SortSpec:
+    """
+    Turns the /query sort dict into a total order by appending _id as a tie-breaker
+    (in the direction of the last sort key), so every page boundary is unambiguous.
+    """
+    spec = [(field, -1 if int(direction) < 0 else 1) for field, direction in sort.items() if field != "_id"]
+    id_direction = int(sort.get("_id", spec[-1][1] if spec else 1))
+    spec.append(("_id", -1 if id_direction < 0 else 1))
+    return spec
+
+
+def encode_cursor(doc: dict, spec: SortSpec) -> str:
+    payload = {"sort": spec, "values": [get_path(doc, field) for field, _ in spec]}
+    return base64.urlsafe_b64encode(json_util.dumps(payload).encode()).decode()
+
+
+def decode_cursor(token: str, spec: SortSpec) -> list:
+    """
+    Returns the sort-key values stored in `token`. Raises ValueError if the token
+    is malformed or was issued for a different sort.
+    """
+    try:
+        payload = json_util.loads(base64.urlsafe_b64decode(token.encode()).decode())
+        token_spec = [(field, direction) for field, direction in payload["sort"]]
+        values = payload["values"]
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError, KeyError, TypeError, ValueError):
+        raise ValueError("Malformed cursor")
+    if token_spec != spec or len(values) != len(spec):
+        raise ValueError("Cursor does not match the requested sort")
+    return values
+
+
+def _after(field: str, direction: int, value: Any):
+    # Condition for `field` sorting strictly after `value`. Missing/null values
+    # sort lowest, so they come first ascending and last descending.
+    if direction == 1:
+        if value is None:
+            return {field: {"$ne": None}}
+        return {field: {"$gt": value}}
+    if value is None:
+        return None
+    return {"$or": [{field: {"$lt": value}}, {field: None}]}
+
+
+def keyset_filter(spec: SortSpec, values: list) -> dict:
+    """
+    Builds the filter matching every document after the cursor position:
+    (k1 > v1) OR (k1 == v1 AND k2 > v2) OR ... for the sort keys in `spec`.
+    """
+    branches = []
+    for i, (field, direction) in enumerate(spec):
+        after = _after(field, direction, values[i])
+        if after is not None:
+            equal = [{spec[j][0]: values[j]} for j in range(i)]
+            branches.append({"$and": equal + [after]} if equal else after)
+    if not branches:
+        # The cursor was already at the last possible position
+        return {"_id": {"$exists": False}}
+    return {"$or": branches}
@@ -0,0 +1,53 @@
+import os
+from typing import Iterable, Set
+from backend.services.cache import TTLCache
+
+# Max parent ids remembered per worker
+PARENT_CACHE_SIZE = int(os.getenv("PARENT_CACHE_SIZE", "10000"))
+# Seconds an id is trusted without asking Mongo again. Deletes made by another
+# worker are only seen after this long; the insert endpoints also re-check the
+# parent through the link update, so a stale entry can't leave an orphan.
+PARENT_CACHE_TTL = float(os.getenv("PARENT_CACHE_TTL", "300"))
+
+
+class ParentCache:
+    """
+    Bounded LRU of study/series ids known to exist, so inserts that reference
+    the same parent over and over skip the existence lookup. Filled by inserts
+    and lookups, cleared by invalidate() when a parent goes away.
+    """
+
+    def __init__(self, maxsize: int = PARENT_CACHE_SIZE, ttl: float = PARENT_CACHE_TTL):
+        self._known = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def add(self, collection: str, ids: Iterable) -> None:
+        for _id in ids:
+            self._known.set((collection, _id), True)
+
+    def invalidate(self, collection: str, ids: Iterable) -> None:
+        for _id in ids:
+            self._known.pop((collection, _id))
+
+    def clear(self) -> None:
+        self._known.clear()
+
+    async def filter_existing(self, db, collection: str, ids: Iterable) -> Set:
+        """
+        Returns the subset of `ids` that exist in `collection`. Only ids that
+        aren't cached are looked up, with a single $in query.
+        """
+        ids = set(ids)
+        existing = {_id for _id in ids if (collection, _id) in self._known}
+        missing = ids - existing
+        if missing:
+            cursor = db[collection].find({"_id": {"$in": list(missing)}}, {"_id": 1})
+            found = {doc["_id"] async for doc in cursor}
+            self.add(collection, found)
+            existing |= found
+        return existing
+
+    async def exists(self, db, collection: str, _id) -> bool:
+        return _id in await self.filter_existing(db, collection, [_id])
+
+
+parent_cache = ParentCache()
@@ -0,0 +1,157 @@
+import os
+import re
+from typing import Any, Iterator, List, Optional
+from backend.models.models import StudyModel, SeriesModel, InstanceModel
+from backend.services.cache import TTLCache
+from backend.services.count_service import filter_digest
+from backend.services.index_service import INDEXES
+
+# Cost guard for user- and LLM-supplied filters. The queryPlanner explain is
+# cheap (nothing is executed), so every query against a large collection is
+# checked for plans that would read the whole collection or index.
+
+# What to do with an expensive query:
+# - "reject": refuse it (400) with suggestions
+# - "limit":  run it with maxTimeMS=QUERY_GUARD_MAX_TIME_MS and return suggestions
+# - "warn":   run it unchanged and return suggestions
+# - "off":    don't explain queries at all
+QUERY_GUARD_MODE = os.getenv("QUERY_GUARD_MODE", "limit").lower()
+# Collections smaller than this are never guarded; a full scan is cheap there
+QUERY_GUARD_MIN_DOCS = int(os.getenv("QUERY_GUARD_MIN_DOCS", "100000"))
+QUERY_GUARD_MAX_TIME_MS = int(os.getenv("QUERY_GUARD_MAX_TIME_MS", "5000"))
+# Seconds a plan verdict / collection size is reused
+QUERY_GUARD_CACHE_TTL = float(os.getenv("QUERY_GUARD_CACHE_TTL", "60"))
+
+# Index bounds that cover every value, i.e. a scan of the whole index
+FULL_RANGE_BOUNDS = {"[MinKey, MaxKey]", "[MaxKey, MinKey]", '["", {})', '({}, ""]'}
+PROMOTED_MODELS = {"studies": StudyModel, "series": SeriesModel, "instances": InstanceModel}
+
+_size_cache = TTLCache(maxsize=64, ttl=QUERY_GUARD_CACHE_TTL)
+_plan_cache = TTLCache(maxsize=1024, ttl=QUERY_GUARD_CACHE_TTL)
+
+CHEAP = {"expensive": False, "reason": None, "estimated_docs_examined": None, "suggestions": []}
+
+
+def _plan_stages(plan: dict) -> Iterator[dict]:
+    yield plan
+    if "inputStage" in plan:
+        yield from _plan_stages(plan["inputStage"])
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+    # sharded clusters: one winning plan per shard
+    for shard in plan.get("shards", []):
+        yield from _plan_stages(shard.get("winningPlan", {}))
+
+
+def _is_full_scan(stage: dict) -> bool:
+    if stage.get("stage") == "COLLSCAN":
+        return True
+    if stage.get("stage") == "IXSCAN":
+        bounds = stage.get("indexBounds", {})
+        return bool(bounds) and all(
+            all(b in FULL_RANGE_BOUNDS for b in field_bounds) for field_bounds in bounds.values()
+        )
+    return False
+
+
+def _walk_conditions(query: Any) -> Iterator[tuple]:
+    # Yields (field, condition) for every field condition in a filter
+    if isinstance(query, list):
+        for item in query:
+            yield from _walk_conditions(item)
+    elif isinstance(query, dict):
+        for key, value in query.items():
+            if key.startswith("$"):
+                yield from _walk_conditions(value)
+            else:
+                yield key, value
+
+
+def _indexed_prefixes(collection: str) -> set:
+    # Fields an index can seek on: the first key of each registered index
+    return {next(iter(index.document["key"])) for index in INDEXES.get(collection, [])}
+
+
+def suggest_alternatives(collection: str, query: dict) -> List[str]:
+    """
+    Hints for rewriting `query` so it can use an index: promoted fields instead
+    of metadata keys, anchored regexes, and the indexed fields of the collection.
+    """
+    suggestions = []
+    model = PROMOTED_MODELS.get(collection)
+    promoted = {re.sub(r"[^a-z0-9]", "", f.lower()): f for f in model.model_fields} if model else {}
+    indexed = _indexed_prefixes(collection)
+
+    for field, condition in _walk_conditions(query):
+        if field.startswith("metadata."):
+            key = re.sub(r"[^a-z0-9]", "", field[len("metadata."):].lower())
+            if key in promoted and promoted[key] in indexed:
+                suggestions.append(f"Filter on the indexed field '{promoted[key]}' instead of '{field}'.")
+        if isinstance(condition, dict) and "$regex" in condition:
+            pattern = str(condition["$regex"])
+            options = str(condition.get("$options", ""))
+            if not pattern.startswith("^") or "i" in options:
+                suggestions.append(
+                    f"Anchor the regex on '{field}' with ^ and drop case-insensitivity, "
+                    f"or use an exact match, so it can use an index."
+                )
+    if indexed:
+        suggestions.append(f"Indexed fields on {collection}: {', '.join(sorted(indexed))}.")
+    return suggestions
+
+
+async def _collection_size(db, collection: str) -> int:
+    size = _size_cache.get(collection)
+    if size is None:
+        size = await db[collection].estimated_document_count()
+        _size_cache.set(collection, size)
+    return size
+
+
+async def assess_query(db, collection: str, query: dict, sort: Optional[list] = None, limit: Optional[int] = None) -> dict:
+    """
+    Explains `query` (queryPlanner verbosity) and reports whether its winning
+    plan reads the whole collection or a whole index:
+    {"expensive", "reason", "estimated_docs_examined", "suggestions"}.
+    A full scan that stops after `limit` documents (no residual filter, no
+    in-memory sort) is not expensive.
+    """
+    if QUERY_GUARD_MODE == "off":
+        return CHEAP
+    size = await _collection_size(db, collection)
+    if size < QUERY_GUARD_MIN_DOCS:
+        return CHEAP
+
+    key = (collection, filter_digest(query), filter_digest(sort or []), limit)
+    verdict = _plan_cache.get(key)
+    if verdict is not None:
+        return verdict
+
+    find = {"find": collection, "filter": query}
+    if sort:
+        find["sort"] = dict(sort)
+    if limit:
+        find["limit"] = limit
+    explain = await db.command({"explain": find, "verbosity": "queryPlanner"})
+    winning = explain["queryPlanner"]["winningPlan"]
+    # Slot-based engine plans wrap the classic tree in "queryPlan"
+    plan = winning.get("queryPlan", winning)
+    stages = list(_plan_stages(plan))
+    full_scans = [stage for stage in stages if _is_full_scan(stage)]
+    # Without these the scan ends after `limit` documents
+    filtered = any("filter" in stage for stage in stages)
+    blocking_sort = any(stage.get("stage") == "SORT" for stage in stages)
+
+    if full_scans and (not limit or filtered or blocking_sort):
+        stage = full_scans[0]
+        reason = "COLLSCAN" if stage["stage"] == "COLLSCAN" else f"full scan of index {stage.get('indexName')}"
+        verdict = {
+            "expensive": True,
+            "reason": f"{reason} over ~{size} documents in {collection}",
+            "estimated_docs_examined": size,
+            "suggestions": suggest_alternatives(collection, query),
+        }
+    else:
+        verdict = CHEAP
+    _plan_cache.set(key, verdict)
+    return verdict
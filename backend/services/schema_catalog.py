@@ -0,0 +1,211 @@
+import asyncio
+import logging
+import os
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# Catalog of the metadata keys seen per collection: one document per
+# (collection, key) with the number of documents carrying the key, the observed
+# value types ({"string": 10, "null": 2}) and the research collections the
+# documents belong to. Ingest keeps it up to date, so field discovery is an
+# indexed lookup instead of a scan over documents' metadata. updated_at is the
+# last time ingest or a rebuild wrote the entry.
+CATALOG_COLLECTION = "schema_catalog"
+CATALOGED_COLLECTIONS = ("studies", "series", "instances")
+
+# Seconds between rebuilds of collections whose documents were updated in place
+CATALOG_REBUILD_INTERVAL = float(os.getenv("CATALOG_REBUILD_INTERVAL", "300"))
+
+# Bumped whenever this process adds a key to the catalog, so schema consumers
+# can tell their view of the fields is stale without querying the catalog
+catalog_version = 0
+
+# Collections with documents updated in place (upsert ingest). Ingest only
+# counts new documents, so these are rebuilt by run_catalog_rebuilds.
+_stale = set()
+
+
+def _type_name(value) -> str:
+    # Same names as the $type aggregation operator, so rebuilds and ingest agree
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "bool"
+    if isinstance(value, int):
+        return "int" if -2**31 <= value < 2**31 else "long"
+    if isinstance(value, float):
+        return "double"
+    if isinstance(value, str):
+        return "string"
+    if isinstance(value, list):
+        return "array"
+    if isinstance(value, dict):
+        return "object"
+    if isinstance(value, ObjectId):
+        return "objectId"
+    return type(value).__name__
+
+
+async def record_metadata_fields(db, collection: str, docs: Iterable[dict]) -> None:
+    """
+    Folds the metadata keys of newly written documents into the catalog with a
+    single bulk_write. Failures are logged, never raised: the documents are
+    already written and the catalog can be rebuilt.
+    """
+    global catalog_version
+    entries = defaultdict(lambda: {"count": 0, "types": Counter(), "collection_ids": set()})
+    for doc in docs:
+        for key, value in (doc.get("metadata") or {}).items():
+            entry = entries[key]
+            entry["count"] += 1
+            entry["types"][_type_name(value)] += 1
+            entry["collection_ids"].update(doc.get("collection_ids") or [])
+    if not entries:
+        return
+
+    now = datetime.now(timezone.utc)
+    ops = []
+    for key, entry in entries.items():
+        update = {
+            "$inc": {"count": entry["count"], **{f"types.{t}": n for t, n in entry["types"].items()}},
+            "$set": {"updated_at": now},
+        }
+        if entry["collection_ids"]:
+            update["$addToSet"] = {"collection_ids": {"$each": list(entry["collection_ids"])}}
+        ops.append(UpdateOne({"collection": collection, "key": key}, update, upsert=True))
+    try:
+        result = await db[CATALOG_COLLECTION].bulk_write(ops, ordered=False)
+    except PyMongoError:
+        logger.exception("Failed to update the schema catalog for %s", collection)
+        return
+    if result.upserted_count:
+        catalog_version += 1
+
+
+def mark_catalog_stale(collection: str) -> None:
+    _stale.add(collection)
+
+
+async def get_metadata_fields(db, collection: str, collection_id: Optional[str] = None) -> List[str]:
+    query = {"collection": collection}
+    if collection_id:
+        query["collection_ids"] = ObjectId(collection_id)
+    cursor = db[CATALOG_COLLECTION].find(query, {"_id": 0, "key": 1}).sort("key", 1)
+    return [doc["key"] async for doc in cursor]
+
+
+async def get_metadata_summary(db, collection: str) -> Dict[str, dict]:
+    # key -> {"count", "types": value types seen for it, nulls aside}, keys in sorted order
+    cursor = db[CATALOG_COLLECTION].find(
+        {"collection": collection}, {"_id": 0, "key": 1, "count": 1, "types": 1}
+    ).sort("key", 1)
+    return {
+        doc["key"]: {
+            "count": doc.get("count", 0),
+            "types": sorted(t for t, n in (doc.get("types") or {}).items() if n and t != "null"),
+        }
+        async for doc in cursor
+    }
+
+
+async def get_catalog(db, collection: str) -> List[dict]:
+    cursor = db[CATALOG_COLLECTION].find({"collection": collection}, {"_id": 0}).sort("key", 1)
+    return await cursor.to_list(length=None)
+
+
+async def rebuild_catalog(db, collection: str) -> int:
+    """
+    Recomputes the catalog of `collection` from its documents (one aggregation),
+    upserts every key stamped with the rebuild start, then drops keys no
+    document has anymore. Returns the number of keys cataloged.
+
+    Entries ingest writes while the rebuild runs carry a newer updated_at:
+    the rebuild leaves them (and their increments) alone and marks the
+    collection stale, so the next rebuild recounts them.
+    """
+    global catalog_version
+    started = datetime.now(timezone.utc)
+    pipeline = [
+        {"$project": {"kv": {"$objectToArray": {"$ifNull": ["$metadata", {}]}}, "collection_ids": 1}},
+        {"$unwind": "$kv"},
+        {"$group": {
+            "_id": {"key": "$kv.k", "type": {"$type": "$kv.v"}},
+            "count": {"$sum": 1},
+            "collection_ids": {"$addToSet": "$collection_ids"},
+        }},
+    ]
+    entries = defaultdict(lambda: {"count": 0, "types": {}, "collection_ids": set()})
+    async for doc in db[collection].aggregate(pipeline, allowDiskUse=True):
+        entry = entries[doc["_id"]["key"]]
+        entry["count"] += doc["count"]
+        entry["types"][doc["_id"]["type"]] = doc["count"]
+        for ids in doc["collection_ids"]:
+            entry["collection_ids"].update(ids or [])
+
+    catalog = db[CATALOG_COLLECTION]
+    # Written by ingest since the rebuild started: keep the stored entry
+    newer = {"$gt": [{"$ifNull": ["$updated_at", None]}, started]}
+    ops = [
+        UpdateOne(
+            {"collection": collection, "key": key},
+            [{"$set": {
+                field: {"$cond": [newer, f"${field}", {"$literal": value}]}
+                for field, value in (
+                    ("count", entry["count"]),
+                    ("types", entry["types"]),
+                    ("collection_ids", list(entry["collection_ids"])),
+                    ("updated_at", started),
+                )
+            }}],
+            upsert=True
+        )
+        for key, entry in entries.items()
+    ]
+    if ops:
+        try:
+            await catalog.bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            # An upsert racing ingest's upsert of a new key loses on the unique
+            # index; ingest's entry is newer anyway. Anything else is a failure.
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+    await catalog.delete_many({"collection": collection, "updated_at": {"$not": {"$gte": started}}})
+    if await catalog.count_documents({"collection": collection, "updated_at": {"$gt": started}}, limit=1):
+        mark_catalog_stale(collection)
+    catalog_version += 1
+    return len(entries)
+
+
+async def backfill_catalog_if_empty(db) -> None:
+    # One-time backfill for databases that predate the catalog
+    try:
+        if await db[CATALOG_COLLECTION].estimated_document_count() > 0:
+            return
+        for collection in CATALOGED_COLLECTIONS:
+            count = await rebuild_catalog(db, collection)
+            logger.info("Schema catalog backfilled %d metadata keys for %s", count, collection)
+    except PyMongoError:
+        logger.exception("Schema catalog backfill failed")
+
+
+async def run_catalog_rebuilds(db, interval: float = CATALOG_REBUILD_INTERVAL) -> None:
+    # Background loop, started from the app lifespan: backfills an empty
+    # catalog, then rebuilds the collections marked stale, at most once per interval
+    await backfill_catalog_if_empty(db)
+    while True:
+        await asyncio.sleep(interval)
+        collections = list(_stale)
+        _stale.difference_update(collections)
+        for collection in collections:
+            try:
+                count = await rebuild_catalog(db, collection)
+                logger.info("Schema catalog rebuilt %d metadata keys for %s", count, collection)
+            except PyMongoError:
+                logger.exception("Schema catalog rebuild failed for %s", collection)
+                _stale.add(collection)
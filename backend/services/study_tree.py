@@ -0,0 +1,54 @@
+import os
+from typing import List, Optional
+from bson import ObjectId
+from backend.services.cache import TTLCache
+
+# Seconds an encoded study tree is reused; 0 disables the cache. New series or
+# instances show up in the tree after at most this long.
+STUDY_TREE_CACHE_TTL = float(os.getenv("STUDY_TREE_CACHE_TTL", "10"))
+STUDY_TREE_CACHE_SIZE = int(os.getenv("STUDY_TREE_CACHE_SIZE", "256"))
+# Default and max instances embedded per series, which keeps the tree (a
+# single aggregation result) well below the 16MB document limit
+TREE_INSTANCES_PER_SERIES = 1000
+TREE_MAX_INSTANCES_PER_SERIES = 10000
+
+tree_cache = TTLCache(maxsize=STUDY_TREE_CACHE_SIZE, ttl=STUDY_TREE_CACHE_TTL)
+
+
+def _project(projection: Optional[dict]) -> List[dict]:
+    return [{"$project": projection}] if projection else []
+
+
+def study_tree_pipeline(
+    study_id: ObjectId,
+    depth: int = 2,
+    study_projection: Optional[dict] = None,
+    series_projection: Optional[dict] = None,
+    instance_projection: Optional[dict] = None,
+    max_instances: int = TREE_INSTANCES_PER_SERIES,
+) -> List[dict]:
+    """
+    One aggregation returning the study with its series (depth >= 1, by
+    series_number) and each series' instances (depth 2, by instance_number)
+    embedded. The $lookups seek the study_id / series_id indexes.
+    """
+    pipeline = [{"$match": {"_id": study_id}}] + _project(study_projection)
+    if depth >= 1:
+        series_stages = [{"$sort": {"series_number": 1, "_id": 1}}] + _project(series_projection)
+        if depth >= 2:
+            series_stages.append({"$lookup": {
+                "from": "instances",
+                "localField": "_id",
+                "foreignField": "series_id",
+                "pipeline": [{"$sort": {"instance_number": 1, "_id": 1}}, {"$limit": max_instances}]
+                + _project(instance_projection),
+                "as": "instances",
+            }})
+        pipeline.append({"$lookup": {
+            "from": "series",
+            "localField": "_id",
+            "foreignField": "study_id",
+            "pipeline": series_stages,
+            "as": "series",
+        }})
+    return pipeline
@@ -1,5 +1,5 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 class BaseLLMClient(ABC):
     @abstractmethod
@@ -7,4 +7,25 @@ class BaseLLMClient(ABC):
         """
         Translate a natural language user query into a MongoDB query dict.
         """
-        pass 
\ No newline at end of file
+        pass
+
+    async def translate_fast(self, user_query: str) -> Optional[Dict[str, Any]]:
+        """
+        Translate without calling a model, or return None. Clients that can
+        answer some queries cheaply override this, so callers can skip
+        queueing for the model.
+        """
+        return None
+
+    async def translate_model(self, user_query: str) -> Dict[str, Any]:
+        """
+        Translate with the model only, skipping translate_fast. Used by
+        callers that already tried the fast path.
+        """
+        return await self.translate(user_query)
+
+    async def aclose(self) -> None:
+        """
+        Release pooled connections. Called once at app shutdown.
+        """
+        pass
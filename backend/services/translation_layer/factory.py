@@ -1,13 +1,34 @@
 import os
+from typing import Optional
 from .base import BaseLLMClient
 from .models.gemma_ollama import GemmaOllamaLLMClient
+from .models.rule_based import RuleBasedLLMClient
 # from .models.local import LocalLLMClient  
 
-def get_llm_client() -> BaseLLMClient:
+# Answer simple questions with the rule-based translator before calling the model
+LLM_FAST_PATH = os.getenv("LLM_FAST_PATH", "1") == "1"
+
+# One client per process, so its connection pool is reused across requests
+_client: Optional[BaseLLMClient] = None
+
+def create_llm_client() -> BaseLLMClient:
     backend = os.getenv("LLM_BACKEND", "gemma_ollama").lower()
     if backend == "gemma_ollama":
-        return GemmaOllamaLLMClient()
+        client = GemmaOllamaLLMClient()
     # elif backend == "local":
-    #     return LocalLLMClient()
+    #     client = LocalLLMClient()
     else:
-        raise ValueError(f"Unknown LLM_BACKEND: {backend}") 
\ No newline at end of file
+        raise ValueError(f"Unknown LLM_BACKEND: {backend}")
+    return RuleBasedLLMClient(client) if LLM_FAST_PATH else client
+
+def get_llm_client() -> BaseLLMClient:
+    global _client
+    if _client is None:
+        _client = create_llm_client()
+    return _client
+
+async def close_llm_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
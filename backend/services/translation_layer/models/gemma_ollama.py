@@ -1,27 +1,51 @@
+import json
 import os
 from typing import Dict, Any
 import httpx
 from ..base import BaseLLMClient
 from ..utils.prompts import build_prompt
-from ..utils.parser import extract_json
+from ..utils.parser import extract_json, JsonObjectScanner
 from backend.services.db_service import get_db
 
+# Connections kept open to Ollama, shared by every request
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "8"))
+
 class GemmaOllamaLLMClient(BaseLLMClient):
     def __init__(self, base_url: str = "", model: str = ""):
         self.base_url = base_url or os.getenv("OLLAMA_BASE_URL", "http://ollama:11434")
         self.model = model or os.getenv("OLLAMA_MODEL", "gemma3:12b")
+        self.session = httpx.AsyncClient(
+            base_url=self.base_url,
+            limits=httpx.Limits(
+                max_connections=OLLAMA_MAX_CONNECTIONS,
+                max_keepalive_connections=OLLAMA_MAX_CONNECTIONS,
+            ),
+            timeout=httpx.Timeout(60.0, connect=5.0),
+        )
 
     async def translate(self, user_query: str) -> Dict[str, Any]:
         prompt = await build_prompt(user_query, get_db())
-        url = f"{self.base_url}/api/generate"
         payload = {
             "model": self.model,
             "prompt": prompt,
-            "stream": False
+            "stream": True
         }
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(url, json=payload)
+        # Tokens arrive as NDJSON lines; stop reading as soon as they contain a
+        # complete JSON object. Closing the response early cancels the rest of
+        # the generation on the Ollama side.
+        scanner = JsonObjectScanner()
+        async with self.session.stream("POST", "/api/generate", json=payload) as response:
             response.raise_for_status()
-            data = response.json()
-            llm_output = data.get("response", "")
-        return extract_json(llm_output) 
\ No newline at end of file
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                parsed = scanner.feed(chunk.get("response", ""))
+                if parsed is not None:
+                    return parsed
+                if chunk.get("done"):
+                    break
+        return extract_json(scanner.text)
+
+    async def aclose(self) -> None:
+        await self.session.aclose()
@@ -0,0 +1,244 @@
+import re
+import typing
+from typing import Any, Dict, Optional, Tuple
+from ..base import BaseLLMClient
+from ..utils.registry import get_collections
+from ..utils.schema_snapshot import schema_snapshot, SchemaSnapshot
+from backend.routes.db_routes import MODEL_MAP
+from backend.services.db_service import get_db
+
+# Deterministic translator for simple questions such as "studies with modality CT",
+# "CT studies from 2022" or "series with BodyPartExamined CHEST and slice
+# thickness below 2". It only answers when every word of the question is
+# accounted for by the grammar and every field exists in the schema snapshot;
+# anything else goes to the wrapped LLM client.
+
+# Words naming each collection
+COLLECTION_WORDS = {
+    "study": "studies", "studies": "studies",
+    "series": "series",
+    "instance": "instances", "instances": "instances", "image": "instances", "images": "instances",
+}
+# DICOM modality codes accepted on their own ("CT studies")
+MODALITIES = {
+    "CT", "MR", "PT", "NM", "US", "CR", "DX", "MG", "XA", "RF", "OT", "SC",
+    "SR", "SEG", "RTSTRUCT", "RTPLAN", "RTDOSE", "PR", "KO", "IO", "PX", "ES",
+}
+# Code-string fields whose values are stored upper case
+UPPERCASE_FIELDS = {"modality", "body_part_examined"}
+UPPERCASE_KEYS = {"modality", "bodypartexamined"}
+# Catalog value types of numeric metadata keys
+NUMERIC_TYPES = {"int", "long", "double"}
+# Date field used by "from 2022" / "in 2022"
+DATE_FIELDS = {"studies": "study_date", "series": "series_date"}
+# Standard fields that are links or bookkeeping, not something to filter on
+NON_QUERYABLE_FIELDS = {"id", "metadata", "collection_ids", "series", "instances", "created_at", "updated_at", "embeddings_id"}
+
+PREFIX_RE = re.compile(
+    r"^(?:(?:please\s+)?(?:find|show|get|list|give|return|search|fetch|display)(?:\s+(?:me|for))?\s+)?(?:(?:all|the|every|any)\s+)?",
+    re.I
+)
+YEAR_RE = re.compile(r"^(?:from|in|during|acquired in|performed in)\s+(\d{4})$", re.I)
+# Words that start another clause ("from 2010", "after 2015"), so a value never contains them
+CLAUSE_WORDS = {"from", "in", "during", "since", "after", "before", "between", "where", "with"}
+CONNECTOR_RE = re.compile(r"^(?:with|where|having|whose|that have|that has|which have|which has)\s+", re.I)
+# Longest phrases first, so "greater than or equal to" wins over "greater than"
+OPERATORS = [
+    ("greater than or equal to", "$gte"), ("less than or equal to", "$lte"),
+    ("at least", "$gte"), ("at most", "$lte"),
+    ("greater than", "$gt"), ("more than", "$gt"), ("above", "$gt"), ("over", "$gt"),
+    ("less than", "$lt"), ("fewer than", "$lt"), ("below", "$lt"), ("under", "$lt"),
+    (">=", "$gte"), ("<=", "$lte"), (">", "$gt"), ("<", "$lt"),
+    ("is not", "$ne"), ("not", "$ne"), ("!=", "$ne"),
+    ("equal to", None), ("equals", None), ("==", None), ("=", None), ("is", None), ("of", None), (":", None),
+]
+
+
+def _normalize(phrase: str) -> str:
+    return re.sub(r"[^a-z0-9]", "", phrase.lower())
+
+
+def _field_type(collection: str, field: str):
+    annotation = MODEL_MAP[collection].model_fields[field].annotation
+    args = [a for a in typing.get_args(annotation) if a is not type(None)]
+    return args[0] if args else annotation
+
+
+class RuleBasedTranslator:
+    def __init__(self, snapshot: SchemaSnapshot):
+        # collection -> normalized phrase -> field path; promoted fields win over metadata
+        self.fields: Dict[str, Dict[str, str]] = {}
+        # collection -> metadata keys only ever seen with numeric values
+        self.numeric_keys: Dict[str, frozenset] = {}
+        for collection in get_collections():
+            self.numeric_keys[collection] = frozenset(
+                key for key, types in snapshot.metadata_types.get(collection, {}).items()
+                if types and set(types) <= NUMERIC_TYPES
+            )
+            index = {}
+            for key in sorted(snapshot.metadata_fields.get(collection, ())):
+                index[_normalize(key)] = f"metadata.{key}"
+            for field in snapshot.fields_info.get(collection, []):
+                if field not in NON_QUERYABLE_FIELDS:
+                    index[_normalize(field)] = field
+            self.fields[collection] = index
+
+    def translate(self, user_query: str) -> Optional[Dict[str, Any]]:
+        text = " ".join(user_query.split()).rstrip("?.!").strip()
+        text = PREFIX_RE.sub("", text, count=1)
+        words = text.split(" ")
+
+        # <modality>? <collection word> <conditions>?
+        for i, word in enumerate(words):
+            if word.lower() in COLLECTION_WORDS:
+                collection = COLLECTION_WORDS[word.lower()]
+                leading, rest = words[:i], " ".join(words[i + 1:])
+                break
+        else:
+            return None
+
+        query: Dict[str, Any] = {}
+        if leading:
+            if len(leading) != 1 or leading[0].upper() not in MODALITIES:
+                return None
+            if not self._add(query, collection, "modality", None, leading[0]):
+                return None
+
+        if rest:
+            for clause in re.split(r"\s+and\s+", rest, flags=re.I):
+                if not self._parse_clause(query, collection, clause.strip()):
+                    return None
+        if not query:
+            return None
+        return {collection: query}
+
+    def _parse_clause(self, query: dict, collection: str, clause: str) -> bool:
+        year = YEAR_RE.match(clause)
+        if year:
+            field = DATE_FIELDS.get(collection)
+            if field is None or field in query:
+                return False
+            # Dates are stored as YYYYMMDD strings; an anchored prefix can use the index
+            query[field] = {"$regex": f"^{year.group(1)}"}
+            return True
+
+        clause = CONNECTOR_RE.sub("", clause, count=1)
+        parsed = self._split_clause(collection, clause)
+        if parsed is None:
+            return False
+        phrase, operator, value = parsed
+        return self._add(query, collection, phrase, operator, value)
+
+    def _split_clause(self, collection: str, clause: str) -> Optional[Tuple[str, Optional[str], str]]:
+        # "<field> <operator> <value>"
+        lowered = clause.lower()
+        for word, operator in OPERATORS:
+            pattern = rf"\s*{re.escape(word)}\s*" if not word[0].isalpha() else rf"\s+{re.escape(word)}\s+"
+            for match in re.finditer(pattern, lowered):
+                phrase, value = clause[:match.start()], clause[match.end():]
+                if phrase and value and _normalize(phrase) in self.fields[collection]:
+                    return (phrase, operator, value) if self._is_value(collection, value) else None
+        # "<field> <value>": the longest field phrase that is a known field
+        words = clause.split(" ")
+        for i in range(len(words) - 1, 0, -1):
+            phrase = " ".join(words[:i])
+            if _normalize(phrase) in self.fields[collection]:
+                value = " ".join(words[i:])
+                return (phrase, None, value) if self._is_value(collection, value) else None
+        return None
+
+    def _is_value(self, collection: str, value: str) -> bool:
+        # A value that holds another clause ("CT from 2010", "CT slice thickness 2")
+        # means the grammar didn't cover the question; the LLM gets it instead
+        words = value.split()
+        if len(words) < 2 or re.fullmatch(r"(['\"])[^'\"]*\1", value.strip()):
+            return True
+        if any(word.lower() in CLAUSE_WORDS or re.fullmatch(r"\d{4}", word) for word in words):
+            return False
+        return not any(
+            _normalize(" ".join(words[i:j])) in self.fields[collection]
+            for i in range(len(words)) for j in range(i + 1, len(words) + 1)
+        )
+
+    def _add(self, query: dict, collection: str, phrase: str, operator: Optional[str], raw_value: str) -> bool:
+        field = self.fields[collection].get(_normalize(phrase))
+        if field is None or field in query:
+            return False
+        # "CT or MR", "CT, MR" -> $in
+        parts = re.split(r"\s*,\s*(?:or\s+)?|\s+or\s+", raw_value.strip(), flags=re.I)
+        values = [self._convert(collection, field, part.strip("'\"")) for part in parts]
+        if any(value is None for value in values):
+            return False
+        if len(values) > 1:
+            if operator is not None:
+                return False
+            query[field] = {"$in": values}
+            return True
+        value = values[0]
+        if operator is not None and operator != "$ne" and isinstance(value, str):
+            # Range comparisons only make sense on numbers here
+            return False
+        query[field] = value if operator is None else {operator: value}
+        return True
+
+    def _convert(self, collection: str, field: str, value: str) -> Any:
+        if not value:
+            return None
+        if field.startswith("metadata."):
+            key = field[len("metadata."):]
+            # Only keys the catalog has seen as numbers are compared as numbers;
+            # others (StudyID "1") keep the string
+            if key in self.numeric_keys[collection]:
+                return _number(value)
+            return value.upper() if _normalize(key) in UPPERCASE_KEYS else value
+        field_type = _field_type(collection, field)
+        if field_type is int:
+            number = _number(value)
+            return int(number) if number is not None and float(number).is_integer() else None
+        if field_type is float:
+            return _number(value)
+        if field_type is str:
+            return value.upper() if field in UPPERCASE_FIELDS else value
+        return None
+
+
+def _number(value: str):
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+class RuleBasedLLMClient(BaseLLMClient):
+    """
+    Answers simple questions with RuleBasedTranslator in milliseconds and
+    falls back to the wrapped client for everything else.
+    """
+
+    def __init__(self, fallback: BaseLLMClient):
+        self.fallback = fallback
+        self._translator: Optional[RuleBasedTranslator] = None
+        self._version: Optional[str] = None
+
+    async def translate_fast(self, user_query: str) -> Optional[Dict[str, Any]]:
+        snapshot = await schema_snapshot.get(get_db())
+        if self._version != snapshot.version:
+            self._translator = RuleBasedTranslator(snapshot)
+            self._version = snapshot.version
+        return self._translator.translate(user_query)
+
+    async def translate(self, user_query: str) -> Dict[str, Any]:
+        result = await self.translate_fast(user_query)
+        if result is not None:
+            return result
+        return await self.fallback.translate(user_query)
+
+    async def translate_model(self, user_query: str) -> Dict[str, Any]:
+        return await self.fallback.translate(user_query)
+
+    async def aclose(self) -> None:
+        await self.fallback.aclose()
@@ -1,7 +1,7 @@
 # Parser for extracting MongoDB query from LLM output
 import json
 import re
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 def extract_json(text: str) -> Dict[str, Any]:
     # Try to extract JSON from code block or plain text
@@ -16,3 +16,53 @@ def extract_json(text: str) -> Dict[str, Any]:
         return json.loads(text)
     except Exception:
         return {"error": "Could not parse MongoDB query from LLM output."}
+
+
+class JsonObjectScanner:
+    """
+    Incrementally scans streamed text for the first balanced {...} object that
+    parses as JSON, so generation can stop as soon as the query is complete.
+    Braces inside JSON strings are ignored. Each character is scanned once.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.pos = 0
+        self.start = None
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, chunk: str) -> Optional[Dict[str, Any]]:
+        self.text += chunk
+        while self.pos < len(self.text):
+            ch = self.text[self.pos]
+            self.pos += 1
+            if self.start is None:
+                if ch == "{":
+                    self.start, self.depth = self.pos - 1, 1
+                continue
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch == "{":
+                self.depth += 1
+            elif ch == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    candidate = self.text[self.start:self.pos]
+                    self.start = None
+                    try:
+                        parsed = json.loads(candidate)
+                    except ValueError:
+                        # e.g. Python-style quotes; keep looking, extract_json runs at the end
+                        continue
+                    if isinstance(parsed, dict):
+                        return parsed
+        return None
@@ -1,7 +1,8 @@
 # Hybrid registry for available collections and their fields (standard + metadata)
 from backend.routes.db_routes import MODEL_MAP
+from backend.services import schema_catalog
 from fastapi import Depends, HTTPException
-from typing import List
+from typing import Dict, List
 
 # --- Static helpers for standard fields ---
 def get_collections() -> List[str]:
@@ -23,10 +24,9 @@ def is_valid_field(collection: str, field: str) -> bool:
 async def get_metadata_fields(collection: str, db) -> List[str]:
     if collection not in MODEL_MAP:
         raise ValueError(f"Invalid collection name: {collection}")
-    cursor = db[collection].find({}, {'metadata': 1})
-    metadata_keys = set()
-    async for doc in cursor:
-        metadata_keys.update(doc.get('metadata', {}).keys())
-        if len(metadata_keys) > 100:
-            break
-    return list(metadata_keys)
+    return await schema_catalog.get_metadata_fields(db, collection)
+
+async def get_metadata_summary(collection: str, db) -> Dict[str, dict]:
+    if collection not in MODEL_MAP:
+        raise ValueError(f"Invalid collection name: {collection}")
+    return await schema_catalog.get_metadata_summary(db, collection)
@@ -0,0 +1,146 @@
+# Versioned, in-memory snapshot of the queryable schema (fields + metadata fields)
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+from pymongo.errors import PyMongoError
+from backend.services import schema_catalog
+from .registry import get_collections, get_fields, get_metadata_summary
+
+logger = logging.getLogger(__name__)
+
+# Seconds between background refreshes; also the max age of a snapshot served
+# when the background refresh isn't running
+SCHEMA_REFRESH_INTERVAL = float(os.getenv("SCHEMA_REFRESH_INTERVAL", "60"))
+# Max metadata keys per collection listed in the prompt, the most common first;
+# validation still accepts every cataloged key
+PROMPT_METADATA_KEYS = int(os.getenv("PROMPT_METADATA_KEYS", "100"))
+
+
+def prompt_metadata_keys(
+    metadata_info: Dict[str, List[str]], metadata_counts: Dict[str, Dict[str, int]], limit: int = PROMPT_METADATA_KEYS
+) -> Dict[str, List[str]]:
+    # The `limit` most common keys of each collection, in sorted order
+    result = {}
+    for col, keys in metadata_info.items():
+        counts = metadata_counts.get(col, {})
+        ranked = sorted(keys, key=lambda key: (-counts.get(key, 0), key))
+        result[col] = sorted(ranked[:limit])
+    return result
+
+
+def render_prompt_prefix(collections, fields_info, metadata_info) -> str:
+    # Everything in the prompt except the user query
+    return (
+        "You are an assistant that converts natural language to MongoDB queries for a DICOM metadata filtering service.\n"
+        f"Available collections: {collections}\n"
+        f"Top-level fields per collection: {fields_info}\n"
+        f"Metadata fields per collection: {metadata_info}\n"
+        "Instructions:\n"
+        "- Only use these collections and fields.\n"
+        "- If a field exists as a top-level field, query it directly (e.g., {'studies': {'modality': 'MR'}}).\n"
+        "- If a field is only in metadata, query it as metadata.<field> (e.g., {'studies': {'metadata.StudyDescription': 'Brain MRI'}}).\n"
+        "- Never use $where or JavaScript expressions. Use only standard MongoDB operators.\n"
+        "- Always choose the collection that best matches the user's intent.\n"
+        "- Always output a valid JSON object with double quotes (e.g., {\"instances\": {\"instance_number\": 1}}), not Python syntax.\n"
+        "Examples:\n"
+        "User query: Find all studies with modality MR\n"
+        "Output: {'studies': {'modality': 'MR'}}\n"
+        "User query: Find all instances with instance number 1\n"
+        "Output: {'instances': {'instance_number': 1}}\n"
+        "User query: Find all series with BodyPartExamined CHEST\n"
+        "Output: {'series': {'metadata.BodyPartExamined': 'CHEST'}}\n"
+        "User query: Find all studies from 2022\n"
+        "Output: {'studies': {'study_date': '2022'}}\n"
+    )
+
+
+class SchemaSnapshot:
+    def __init__(
+        self,
+        fields_info: Dict[str, List[str]],
+        metadata_info: Dict[str, List[str]],
+        catalog_version: int,
+        metadata_types: Optional[Dict[str, Dict[str, List[str]]]] = None,
+        metadata_counts: Optional[Dict[str, Dict[str, int]]] = None,
+    ):
+        self.collections = list(fields_info)
+        self.fields_info = fields_info
+        self.metadata_info = metadata_info
+        # collection -> metadata key -> value types the catalog has seen
+        self.metadata_types = metadata_types or {}
+        # Sets for validation lookups
+        self.fields = {col: frozenset(f) for col, f in fields_info.items()}
+        self.metadata_fields = {col: frozenset(f) for col, f in metadata_info.items()}
+        # The prompt only lists the most common keys, so its length stays bounded
+        self.prompt_metadata = prompt_metadata_keys(metadata_info, metadata_counts or {})
+        self.prompt_prefix = render_prompt_prefix(self.collections, fields_info, self.prompt_metadata)
+        self.version = hashlib.sha256(
+            json.dumps([fields_info, metadata_info, self.metadata_types, self.prompt_metadata], sort_keys=True).encode()
+        ).hexdigest()[:16]
+        self.catalog_version = catalog_version
+        self.built_at = time.monotonic()
+
+
+class SchemaSnapshotService:
+    """
+    Holds the current SchemaSnapshot so prompt building and query validation
+    don't hit the database. The snapshot is rebuilt (off the request path when
+    the background refresh runs) after SCHEMA_REFRESH_INTERVAL seconds, and
+    right away when this process's ingest added a new metadata key.
+    """
+
+    def __init__(self, interval: float = SCHEMA_REFRESH_INTERVAL):
+        self.interval = interval
+        self.snapshot: Optional[SchemaSnapshot] = None
+        self._lock = asyncio.Lock()
+
+    def _is_fresh(self) -> bool:
+        return (
+            self.snapshot is not None
+            and self.snapshot.catalog_version == schema_catalog.catalog_version
+            and time.monotonic() - self.snapshot.built_at < self.interval
+        )
+
+    async def refresh(self, db) -> SchemaSnapshot:
+        catalog_version = schema_catalog.catalog_version
+        collections = get_collections()
+        fields_info = {col: get_fields(col) for col in collections}
+        summaries = {col: await get_metadata_summary(col, db) for col in collections}
+        metadata_info = {col: list(summary) for col, summary in summaries.items()}
+        metadata_types = {col: {key: entry["types"] for key, entry in summary.items()} for col, summary in summaries.items()}
+        metadata_counts = {col: {key: entry["count"] for key, entry in summary.items()} for col, summary in summaries.items()}
+        snapshot = SchemaSnapshot(fields_info, metadata_info, catalog_version, metadata_types, metadata_counts)
+        if self.snapshot is not None and self.snapshot.version == snapshot.version:
+            # Same schema: keep the old object, just mark it fresh
+            self.snapshot.catalog_version = catalog_version
+            self.snapshot.built_at = snapshot.built_at
+        else:
+            self.snapshot = snapshot
+        return self.snapshot
+
+    async def get(self, db) -> SchemaSnapshot:
+        if self._is_fresh():
+            return self.snapshot
+        async with self._lock:
+            # Another request may have refreshed while we waited
+            if not self._is_fresh():
+                await self.refresh(db)
+        return self.snapshot
+
+    async def run(self, db) -> None:
+        # Background refresh loop, started from the app lifespan
+        while True:
+            try:
+                async with self._lock:
+                    await self.refresh(db)
+            except PyMongoError:
+                logger.exception("Schema snapshot refresh failed")
+            # Refresh at half the max age, so requests always find a fresh snapshot
+            await asyncio.sleep(self.interval / 2)
+
+
+schema_snapshot = SchemaSnapshotService()
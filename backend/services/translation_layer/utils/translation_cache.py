@@ -0,0 +1,172 @@
+# Cache of validated natural language -> MongoDB query translations
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict
+from bson import json_util
+from pymongo.errors import PyMongoError
+from backend.services.cache import TTLCache
+from .registry import get_collections
+
+logger = logging.getLogger(__name__)
+
+# Seconds a translation stays cached (in memory and in Mongo)
+TRANSLATION_CACHE_TTL = float(os.getenv("TRANSLATION_CACHE_TTL", "86400"))
+# Max translations kept in memory per worker
+TRANSLATION_CACHE_SIZE = int(os.getenv("TRANSLATION_CACHE_SIZE", "1024"))
+# Mongo collection shared by every worker; a TTL index on expires_at drops old entries
+CACHE_COLLECTION = "translation_cache"
+
+
+def normalize_query(user_query: str) -> str:
+    # Whitespace only: case is kept because values like patient IDs are case-sensitive
+    return " ".join(user_query.split())
+
+
+def cache_key(user_query: str, schema_version: str) -> str:
+    normalized = normalize_query(user_query)
+    return hashlib.sha256(f"{schema_version}\0{normalized}".encode()).hexdigest()
+
+
+def is_cacheable(mongo_query: Any) -> bool:
+    # Only real translations are cached: a parse failure such as
+    # {"error": "Could not parse..."} would otherwise be served until it expires
+    return (
+        isinstance(mongo_query, dict)
+        and bool(mongo_query)
+        and "error" not in mongo_query
+        and all(collection in get_collections() for collection in mongo_query)
+    )
+
+
+class TranslationCache:
+    """
+    Two-level cache for /llm/translate: an in-process LRU with TTL in front of a
+    Mongo collection, so entries survive restarts and are shared across workers.
+    Keys include the schema version, so a schema change never serves a
+    translation built against older fields. Concurrent misses on the same key
+    share a single LLM call.
+    """
+
+    def __init__(self, maxsize: int = TRANSLATION_CACHE_SIZE, ttl: float = TRANSLATION_CACHE_TTL):
+        self.ttl = ttl
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.inflight: Dict[str, asyncio.Future] = {}
+        self.memory_hits = 0
+        self.mongo_hits = 0
+        self.coalesced = 0
+        self.misses = 0
+        self.llm_seconds = 0.0
+        self.saved_seconds = 0.0
+
+    async def get_or_translate(
+        self,
+        db,
+        user_query: str,
+        schema_version: str,
+        translate: Callable[[], Awaitable[Dict[str, Any]]],
+    ) -> Dict[str, Any]:
+        """
+        Returns the cached translation of `user_query`, or awaits `translate()`
+        and caches its result. Exceptions raised by `translate` (e.g. an invalid
+        generated query) are propagated and nothing is cached; neither are
+        results that aren't a translation (see is_cacheable).
+        """
+        key = cache_key(user_query, schema_version)
+
+        entry = self.memory.get(key)
+        if entry is not None:
+            self.memory_hits += 1
+            self.saved_seconds += entry["llm_seconds"]
+            return entry["mongo_query"]
+
+        if key in self.inflight:
+            self.coalesced += 1
+            entry = await asyncio.shield(self.inflight[key])
+            self.saved_seconds += entry["llm_seconds"]
+            return entry["mongo_query"]
+
+        task = asyncio.ensure_future(self._load(db, key, user_query, schema_version, translate))
+        self.inflight[key] = task
+        task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        entry = await asyncio.shield(task)
+        return entry["mongo_query"]
+
+    async def _load(self, db, key, user_query, schema_version, translate) -> dict:
+        entry = await self._get_stored(db, key)
+        if entry is not None:
+            self.mongo_hits += 1
+            self.saved_seconds += entry["llm_seconds"]
+            self.memory.set(key, entry)
+            return entry
+
+        self.misses += 1
+        start = time.perf_counter()
+        try:
+            mongo_query = await translate()
+        finally:
+            elapsed = time.perf_counter() - start
+            self.llm_seconds += elapsed
+
+        entry = {"mongo_query": mongo_query, "llm_seconds": elapsed}
+        if not is_cacheable(mongo_query):
+            return entry
+        self.memory.set(key, entry)
+        await self._store(db, key, user_query, schema_version, entry)
+        return entry
+
+    async def _get_stored(self, db, key):
+        try:
+            doc = await db[CACHE_COLLECTION].find_one(
+                {"_id": key, "expires_at": {"$gt": datetime.now(timezone.utc)}}
+            )
+        except PyMongoError:
+            logger.exception("Translation cache lookup failed")
+            return None
+        if doc is None:
+            return None
+        mongo_query = json_util.loads(doc["mongo_query"])
+        if not is_cacheable(mongo_query):
+            return None
+        return {"mongo_query": mongo_query, "llm_seconds": doc["llm_seconds"]}
+
+    async def _store(self, db, key, user_query, schema_version, entry) -> None:
+        now = datetime.now(timezone.utc)
+        doc = {
+            "query": normalize_query(user_query),
+            "schema_version": schema_version,
+            # Stored as JSON: generated queries have $-prefixed keys
+            "mongo_query": json_util.dumps(entry["mongo_query"]),
+            "llm_seconds": entry["llm_seconds"],
+            "created_at": now,
+            "expires_at": now + timedelta(seconds=self.ttl),
+        }
+        try:
+            await db[CACHE_COLLECTION].replace_one({"_id": key}, doc, upsert=True)
+        except PyMongoError:
+            logger.exception("Translation cache write failed")
+
+    def clear(self) -> None:
+        self.memory.clear()
+
+    def stats(self) -> dict:
+        hits = self.memory_hits + self.mongo_hits + self.coalesced
+        requests = hits + self.misses
+        return {
+            "requests": requests,
+            "hits": hits,
+            "memory_hits": self.memory_hits,
+            "mongo_hits": self.mongo_hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "hit_rate": hits / requests if requests else 0.0,
+            "avg_llm_seconds": self.llm_seconds / self.misses if self.misses else None,
+            "latency_saved_seconds": round(self.saved_seconds, 3),
+            "memory_size": len(self.memory),
+        }
+
+
+translation_cache = TranslationCache()
@@ -1,6 +1,7 @@
 # Validators for user input and LLM output
 from typing import Any, Dict
-from .registry import get_collections, get_fields, is_valid_field, get_metadata_fields
+from .registry import get_collections, get_fields, is_valid_field
+from .schema_snapshot import schema_snapshot
 
 SAFE_OPERATORS = {"$and", "$or", "$eq", "$gt", "$lt", "$in", "$regex"}  # Expand as needed
 
@@ -13,7 +14,9 @@ def validate_user_query(user_query: str) -> bool:
 
 def _validate_fields(collection: str, query_fields, standard_fields, metadata_fields) -> bool:
     for field in query_fields:
-        if field not in standard_fields and field not in metadata_fields:
+        # Metadata fields are queried as metadata.<key>
+        key = field[len("metadata."):] if field.startswith("metadata.") else field
+        if field not in standard_fields and key not in metadata_fields:
             return False
     return True
 
@@ -26,12 +29,11 @@ async def validate_mongo_query(mongo_query: Dict[str, Any], db=None) -> bool:
         if op in str(mongo_query).lower():
             return False
     # Validate fields for each collection in the query
+    snapshot = await schema_snapshot.get(db) if db is not None else None
     for collection in get_collections():
         if collection in mongo_query:
-            standard_fields = get_fields(collection)
-            metadata_fields = []
-            if db is not None:
-                metadata_fields = await get_metadata_fields(collection, db)
+            standard_fields = snapshot.fields[collection] if snapshot else get_fields(collection)
+            metadata_fields = snapshot.metadata_fields[collection] if snapshot else frozenset()
             query_fields = mongo_query[collection].keys() if isinstance(mongo_query[collection], dict) else []
             if not _validate_fields(collection, query_fields, standard_fields, metadata_fields):
                 return False
@@ -60,7 +60,7 @@ const SeriesRows = ({ studyId, onViewSeriesDetails }: SeriesRowsProps) => {
           <td colSpan={2} className="pl-10 py-2 text-sm text-gray-700">
             Series {s.series_number ?? '-'}
           </td>
-          <td className="text-xs">{s.instances?.length ?? '-'}</td>
+          <td className="text-xs">{s.instance_count ?? '-'}</td>
           <td className="text-xs">{s.series_description || '-'}</td>
           <td className="text-xs">
             <div className="flex gap-2">
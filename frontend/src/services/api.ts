@@ -71,6 +71,17 @@ export const studiesApi = {
     return apiCall<Study>(`/studies/${studyId}`);
   },
 
+  // Get a study with its series and their instances in one request
+  async getStudyTree(studyId: string, params: { depth?: 0 | 1 | 2; maxInstances?: number } = {}) {
+    const search = new URLSearchParams();
+    if (params.depth !== undefined) search.set('depth', String(params.depth));
+    if (params.maxInstances !== undefined) search.set('max_instances', String(params.maxInstances));
+    const qs = search.toString();
+    return apiCall<Study & { series: (Series & { instances?: Instance[] })[] }>(
+      `/studies/${studyId}/tree${qs ? `?${qs}` : ''}`
+    );
+  },
+
   // Create a new study
   async createStudy(study: Omit<Study, 'id' | 'created_at' | 'updated_at'>): Promise<InsertResponse> {
     return apiCall<InsertResponse>('/studies', {
@@ -79,7 +79,11 @@ export interface Series {
   
   // Links
   collection_ids: ObjectId[];
-  instances: ObjectId[];
+
+  // Instance summary
+  instance_count: number;
+  min_instance_number?: number;
+  max_instance_number?: number;
   
   // For natural-language later
   _search_text?: string;
@@ -0,0 +1,113 @@
+import os
+import sys
+import tempfile
+import time
+import pydicom
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.sequence import Sequence
+from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+from extractor import (
+    PATIENT_DIR, TAGS_CONF_FILE_STUDY, TAGS_CONF_FILE_SERIES, TAGS_CONF_FILE_INSTANCE,
+    walk_dicom_files, load_tags, extract_tags,
+    load_compiled_tags, needed_tags, read_header, extract_compiled_tags
+)
+
+# Compares the full dcmread + keyword lookup path with the tag-targeted fast path.
+# Usage:
+#   python bench_reader.py [DICOM_DIR]     benchmark real files (default PATIENT_DIR)
+#   python bench_reader.py --synthetic     benchmark generated header-heavy files
+MAX_FILES = 200
+# Items in each private sequence of the synthetic files
+PRIVATE_ITEMS = 500
+
+
+# Write `count` small CT headers carrying large private sequences: one below the
+# highest configured tag (defined length, skipped via specific_tags) and one of
+# undefined length above it, like vendor CSA groups, which dcmread has to parse
+# item by item but the fast path never reaches.
+def make_header_heavy_files(out_dir, count):
+    study_uid, series_uid = generate_uid(), generate_uid()
+    for i in range(count):
+        ds = Dataset()
+        ds.file_meta = FileMetaDataset()
+        ds.file_meta.TransferSyntaxUID = ExplicitVRLittleEndian
+        ds.file_meta.MediaStorageSOPClassUID = "1.2.840.10008.5.1.4.1.1.2"
+        ds.SOPClassUID = "1.2.840.10008.5.1.4.1.1.2"
+        ds.SOPInstanceUID = generate_uid()
+        ds.file_meta.MediaStorageSOPInstanceUID = ds.SOPInstanceUID
+        ds.StudyInstanceUID = study_uid
+        ds.SeriesInstanceUID = series_uid
+        ds.PatientID = "BENCH"
+        ds.Modality = "CT"
+        ds.InstanceNumber = i
+        ds.SliceThickness = 1.25
+        ds.ImagePositionPatient = [0.0, 0.0, float(i)]
+
+        for group, undefined in ((0x0019, False), (0x7FD1, True)):
+            block = ds.private_block(group, "BENCH", create=True)
+            items = []
+            for j in range(PRIVATE_ITEMS):
+                item = Dataset()
+                item.add_new(0x00091001, "LO", f"value {j}")
+                item.add_new(0x00091002, "DS", [j, j + 1, j + 2])
+                item.add_new(0x00091003, "OB", bytes(64))
+                items.append(item)
+            block.add_new(0x01, "SQ", Sequence(items))
+            ds[block.get_tag(0x01)].is_undefined_length = undefined
+
+        ds.save_as(os.path.join(out_dir, f"{i}.dcm"), enforce_file_format=True)
+
+
+def bench_full(paths):
+    tag_lists = [load_tags(TAGS_CONF_FILE_STUDY), load_tags(TAGS_CONF_FILE_SERIES), load_tags(TAGS_CONF_FILE_INSTANCE)]
+    results = []
+    start = time.perf_counter()
+    for path in paths:
+        dcm = pydicom.dcmread(path, stop_before_pixels=True)
+        results.append([extract_tags(dcm, tags) for tags in tag_lists])
+    return time.perf_counter() - start, results
+
+
+def bench_fast(paths):
+    tag_lists = load_compiled_tags()
+    tags = needed_tags(*tag_lists)
+    results = []
+    start = time.perf_counter()
+    for path in paths:
+        dcm = read_header(path, tags)
+        results.append([extract_compiled_tags(dcm, compiled) for compiled in tag_lists])
+    return time.perf_counter() - start, results
+
+
+def run(paths):
+    if not paths:
+        print("No DICOM files found")
+        return
+    # warm the OS file cache so both paths read from memory
+    for path in paths:
+        with open(path, "rb") as f:
+            f.read()
+
+    full_time, full_results = bench_full(paths)
+    fast_time, fast_results = bench_fast(paths)
+
+    print(f"Files:            {len(paths)}")
+    print(f"Full dcmread:     {full_time / len(paths) * 1000:.2f} ms/file")
+    print(f"Fast-path reader: {fast_time / len(paths) * 1000:.2f} ms/file")
+    print(f"Speedup:          {full_time / fast_time:.1f}x")
+    print(f"Identical output: {full_results == fast_results}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--synthetic":
+        with tempfile.TemporaryDirectory() as tmp:
+            make_header_heavy_files(tmp, MAX_FILES // 4)
+            run(list(walk_dicom_files(tmp)))
+    else:
+        base_dir = sys.argv[1] if len(sys.argv) > 1 else PATIENT_DIR
+        paths = []
+        for path in walk_dicom_files(base_dir):
+            paths.append(path)
+            if len(paths) == MAX_FILES:
+                break
+        run(paths)
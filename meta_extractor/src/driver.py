@@ -1,53 +1,302 @@
 import asyncio
+import json
+import os
+import random
+import threading
 import httpx
-from extractor import extract_metadata
+from extractor import extract_metadata, iter_metadata
+from manifest import Manifest
 
 BASE_URL = "http://db-api:8000"
 
+# Streaming mode: upload batches while extraction is still running
+STREAMING = os.getenv("STREAMING", "0") == "1"
+# Max number of extracted batches waiting to be uploaded
+UPLOAD_QUEUE_SIZE = int(os.getenv("UPLOAD_QUEUE_SIZE", "8"))
+# Incremental mode: only parse new/changed files and only upload the deltas
+INCREMENTAL = os.getenv("INCREMENTAL", "0") == "1"
+MANIFEST_PATH = os.getenv("MANIFEST_PATH", "manifest.sqlite")
+
+# Uploader tuning
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "16"))  # requests in flight
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "4"))  # streaming batches uploaded at once
+BULK_SIZE = 500  # records per /bulk request
+MAX_RETRIES = 5
+BACKOFF_BASE = 0.5  # seconds, doubled on every retry
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+DEAD_LETTER_PATH = os.getenv("DEAD_LETTER_PATH", "dead_letter.jsonl")
+
+
+# --- Uploader ---
+
+# Shared HTTP client for the whole run: a keep-alive connection pool, at most
+# UPLOAD_CONCURRENCY requests in flight, retries with exponential backoff on
+# transport errors and 429/5xx, and a JSONL dead-letter file for records the
+# backend still rejects (or that never got a parent id).
+class Uploader:
+    def __init__(self):
+        self.semaphore = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+        self.session = httpx.AsyncClient(
+            base_url=BASE_URL,
+            limits=httpx.Limits(
+                max_connections=UPLOAD_CONCURRENCY,
+                max_keepalive_connections=UPLOAD_CONCURRENCY,
+                keepalive_expiry=30.0,
+            ),
+            timeout=httpx.Timeout(60.0, connect=5.0),
+        )
+        self.dead_letter_file = open(DEAD_LETTER_PATH, "a")
+        self.dead_lettered = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.aclose()
+        self.dead_letter_file.close()
+        if self.dead_lettered:
+            print(f"{self.dead_lettered} records written to {DEAD_LETTER_PATH}")
+
+    def dead_letter(self, path, record, error):
+        self.dead_letter_file.write(json.dumps({"path": path, "record": record, "error": error}) + "\n")
+        self.dead_letter_file.flush()
+        self.dead_lettered += 1
+
+    # POST with retries; returns (response json, None) or (None, last error)
+    async def post(self, path, payload):
+        error = None
+        for attempt in range(MAX_RETRIES + 1):
+            retry_after = None
+            async with self.semaphore:
+                try:
+                    resp = await self.session.post(path, json=payload)
+                except httpx.TransportError as e:
+                    error = f"{type(e).__name__}: {e}"
+                else:
+                    if resp.status_code < 400:
+                        return resp.json(), None
+                    error = f"HTTP {resp.status_code}: {resp.text}"
+                    if resp.status_code not in RETRY_STATUSES:
+                        break
+                    retry_after = resp.headers.get("Retry-After")
+            if attempt < MAX_RETRIES:
+                delay = BACKOFF_BASE * 2 ** attempt * random.uniform(0.5, 1.5)
+                if retry_after and retry_after.isdigit():
+                    delay = max(delay, float(retry_after))
+                await asyncio.sleep(delay)
+        print(f"[{path}] Giving up: {error}")
+        return None, error
+
+    # Post a chunk to one of the /bulk endpoints and return the inserted id
+    # (or None) for each record, in order. Rejected records are dead-lettered.
+    async def post_bulk(self, path, records):
+        if not records:
+            return []
+        data, error = await self.post(path, records)
+        if data is None:
+            for record in records:
+                self.dead_letter(path, record, error)
+            return [None] * len(records)
+
+        for result in data["results"]:
+            if "error" in result:
+                self.dead_letter(path, records[result["index"]], result["error"])
+        return [result.get("inserted_id") for result in data["results"]]
+
+    # Upload records in BULK_SIZE chunks concurrently; records whose parent id
+    # is missing are dead-lettered instead of being sent
+    async def upload(self, path, records, parent_key=None):
+        inserted = [None] * len(records)
+        sendable = []
+        for idx, record in enumerate(records):
+            if parent_key and record.get(parent_key) is None:
+                self.dead_letter(path, record, f"Missing {parent_key}: parent was not uploaded")
+            else:
+                sendable.append(idx)
+
+        chunks = [sendable[i:i + BULK_SIZE] for i in range(0, len(sendable), BULK_SIZE)]
+        chunk_ids = await asyncio.gather(
+            *(self.post_bulk(path, [records[idx] for idx in chunk]) for chunk in chunks)
+        )
+        for chunk, ids in zip(chunks, chunk_ids):
+            for idx, inserted_id in zip(chunk, ids):
+                inserted[idx] = inserted_id
+        return inserted
+
+
 # --- Helpers ---
-async def post(session, path, payload):
-    url = f"{BASE_URL}{path}"
-    try:
-        resp = await session.post(url, json=payload)
-        resp.raise_for_status()
-        return resp.json().get("inserted_id")
-    except httpx.HTTPStatusError as e:
-        print(f"[{path}] HTTP Error: {e.response.text}")
-    except Exception as e:
-        print(f"[{path}] Unexpected Error: {e}")
-    return None
 
-# --- Main Orchestrator ---
-async def run_driver():
-    print("Extracting metadata...")
-    extracted = extract_metadata()
-    studies = extracted["studies"]
-    series = extracted["series"]
-    instances = extracted["instances"]
+# Record the files whose instances made it to the backend, so the next
+# incremental run skips them
+def record_uploaded_files(manifest, files, instances, inserted):
+    uploaded = {i["sop_instance_uid"] for i, inserted_id in zip(instances, inserted) if inserted_id}
+    manifest.record_files(f for f in files if f["sop_instance_uid"] in uploaded)
+
+# UID -> backend id maps shared by every batch of a run. Parents that another
+# batch is still uploading are tracked as pending futures, so concurrent
+# batches wait for them instead of seeing a missing parent id.
+class ParentIds:
+    def __init__(self, known=None):
+        self.ids = dict(known or {})
+        self.pending = {}
 
-    study_uid_to_id = {}
-    series_uid_to_id = {}
+    # claim the uids this batch has to upload; returns only the unclaimed ones
+    def claim(self, uids):
+        loop = asyncio.get_running_loop()
+        claimed = []
+        for uid in uids:
+            if uid not in self.ids and uid not in self.pending:
+                self.pending[uid] = loop.create_future()
+                claimed.append(uid)
+        return claimed
 
-    async with httpx.AsyncClient() as session:
-        # Insert studies
+    def resolve(self, uid, backend_id):
+        if backend_id:
+            self.ids[uid] = backend_id
+        self.pending.pop(uid).set_result(backend_id)
+
+    # resolve whatever is still pending of `uids` as failed (no id)
+    def release(self, uids):
+        for uid in uids:
+            if uid in self.pending:
+                self.pending.pop(uid).set_result(None)
+
+    async def get(self, uid):
+        if uid in self.pending:
+            return await self.pending[uid]
+        return self.ids.get(uid)
+
+# Upload one extracted batch: new studies, then new series, then instances.
+# Studies/series already known (earlier batches or, in incremental mode,
+# earlier runs) are not sent again. Both levels are claimed before the first
+# await, so batches taken later from the queue always see them as pending.
+async def upload_batch(uploader, batch, study_ids, series_ids, manifest=None):
+    claimed = set(study_ids.claim(st["study_instance_uid"] for st in batch["studies"]))
+    claimed_series = set(series_ids.claim(s["series_instance_uid"] for s in batch["series"]))
+    try:
+        studies = [st for st in batch["studies"] if st["study_instance_uid"] in claimed]
         for study in studies:
             study["collection_ids"] = []  # <-- Update with real collection links
-            inserted_id = await post(session, "/studies", study)
+        inserted = await uploader.upload("/studies/bulk?upsert=true", studies)
+        new_ids = {}
+        for study, inserted_id in zip(studies, inserted):
+            study_ids.resolve(study["study_instance_uid"], inserted_id)
             if inserted_id:
-                study_uid_to_id[study["study_instance_uid"]] = inserted_id
+                new_ids[study["study_instance_uid"]] = inserted_id
+        if manifest:
+            manifest.record_uploads("study", new_ids)
+    except BaseException:
+        series_ids.release(claimed_series)
+        raise
+    finally:
+        study_ids.release(claimed)
 
-        # Insert series
+    try:
+        series = [s for s in batch["series"] if s["series_instance_uid"] in claimed_series]
         for s in series:
-            s["study_id"] = study_uid_to_id.get(s["study_instance_uid"])
+            s["study_id"] = await study_ids.get(s["study_instance_uid"])
             s["collection_ids"] = []  # <-- Update with real collection links
-            inserted_id = await post(session, "/series", s)
+        inserted = await uploader.upload("/series/bulk?upsert=true", series, parent_key="study_id")
+        new_ids = {}
+        for s, inserted_id in zip(series, inserted):
+            series_ids.resolve(s["series_instance_uid"], inserted_id)
             if inserted_id:
-                series_uid_to_id[s["series_instance_uid"]] = inserted_id
+                new_ids[s["series_instance_uid"]] = inserted_id
+        if manifest:
+            manifest.record_uploads("series", new_ids)
+    finally:
+        series_ids.release(claimed_series)
+
+    instances = batch["instances"]
+    for i in instances:
+        i["series_id"] = await series_ids.get(i["series_instance_uid"])
+    inserted = await uploader.upload("/instances/bulk?upsert=true", instances, parent_key="series_id")
+    if manifest:
+        record_uploaded_files(manifest, batch["files"], instances, inserted)
+
+# --- Main Orchestrator ---
+async def run_driver(manifest=None):
+    print("Extracting metadata...")
+    extracted = extract_metadata(manifest=manifest)
 
-        # Insert instances
-        for i in instances:
-            i["series_id"] = series_uid_to_id.get(i["series_instance_uid"])
-            await post(session, "/instances", i)
+    # In incremental mode, parents uploaded by earlier runs are reused
+    study_ids = ParentIds(manifest.uploaded_ids("study") if manifest else None)
+    series_ids = ParentIds(manifest.uploaded_ids("series") if manifest else None)
+
+    async with Uploader() as uploader:
+        await upload_batch(uploader, extracted, study_ids, series_ids, manifest)
+
+# --- Streaming Orchestrator ---
+async def run_streaming_driver(manifest=None):
+    print("Extracting and uploading metadata...")
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=UPLOAD_QUEUE_SIZE)
+    # Set when the run fails: the producer stops extracting
+    stop = threading.Event()
+
+    def put_sentinels_nowait():
+        # Runs on the loop; the consumers are gone, so nothing may block
+        for _ in range(UPLOAD_WORKERS):
+            try:
+                queue.put_nowait(None)
+            except asyncio.QueueFull:
+                break
+
+    # Producer: the extractor is blocking, so it runs in a worker thread and
+    # waits on the bounded queue whenever the uploaders fall behind
+    def produce():
+        try:
+            for batch in iter_metadata(manifest=manifest):
+                if stop.is_set():
+                    break
+                asyncio.run_coroutine_threadsafe(queue.put(batch), loop).result()
+        finally:
+            if stop.is_set():
+                loop.call_soon_threadsafe(put_sentinels_nowait)
+            else:
+                for _ in range(UPLOAD_WORKERS):
+                    asyncio.run_coroutine_threadsafe(queue.put(None), loop).result()
+
+    # Consumers: only the UID -> id maps outlive a batch
+    study_ids = ParentIds(manifest.uploaded_ids("study") if manifest else None)
+    series_ids = ParentIds(manifest.uploaded_ids("series") if manifest else None)
+
+    async def consume(uploader):
+        while True:
+            batch = await queue.get()
+            if batch is None:
+                break
+            await upload_batch(uploader, batch, study_ids, series_ids, manifest)
+
+    async with Uploader() as uploader:
+        producer = asyncio.ensure_future(asyncio.to_thread(produce))
+        consumers = [asyncio.ensure_future(consume(uploader)) for _ in range(UPLOAD_WORKERS)]
+        try:
+            await asyncio.gather(producer, *consumers)
+        except BaseException:
+            # gather doesn't cancel the rest: stop the producer, cancel the
+            # consumers and drain the queue until the producer thread (maybe
+            # blocked on a full queue) has returned
+            stop.set()
+            for consumer in consumers:
+                consumer.cancel()
+            await asyncio.gather(*consumers, return_exceptions=True)
+            while not producer.done():
+                while not queue.empty():
+                    queue.get_nowait()
+                await asyncio.wait({producer}, timeout=0.1)
+            raise
+
+async def main():
+    manifest = Manifest(MANIFEST_PATH) if INCREMENTAL else None
+    try:
+        if STREAMING:
+            await run_streaming_driver(manifest)
+        else:
+            await run_driver(manifest)
+    finally:
+        if manifest:
+            manifest.close()
 
 if __name__ == "__main__":
-    asyncio.run(run_driver())
+    asyncio.run(main())
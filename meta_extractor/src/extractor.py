@@ -1,7 +1,10 @@
 import os
-import pydicom
+from pydicom.datadict import tag_for_keyword
+from pydicom.filereader import read_partial
 from pydicom.multival import MultiValue
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 
 import os
 
@@ -17,7 +20,17 @@ DB_NAME = "dicomdb"
 RESEARCHER_NAME = "test"
 COLLECTION_NAME = "test"
 
+# Parallel extraction: number of worker processes (1 = serial) and files per shard
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "1"))
+SHARD_SIZE = 256
 
+# Fast-path reader: values longer than this are skipped while parsing and only
+# read if they are actually accessed
+DEFER_SIZE = "64 KB"
+
+
+
+UID_KEYWORDS = ["StudyInstanceUID", "SeriesInstanceUID", "SOPInstanceUID"]
 
 # Indexed fields to be promoted
 STUDY_PROMOTED_MAPPING = {
@@ -65,21 +78,70 @@ def load_tags(conf_path):
         return [line.strip() for line in f if line.strip() and not line.startswith("#")]
 
 
+def safe_convert(value):
+    if value is None:
+        return None
+    if isinstance(value, (list, MultiValue)):
+        return [safe_convert(v) for v in value]
+    try:
+        return float(value) if isinstance(value, (int, float)) else str(value)
+    except Exception:
+        return None
+
+
 # return a dictionary of dicom tag:value from dcm and list of tags
 def extract_tags(dcm, tags):
-    def safe_convert(value):
-        if value is None:
-            return None
-        if isinstance(value, (list, MultiValue)):
-            return [safe_convert(v) for v in value]
-        try:
-            return float(value) if isinstance(value, (int, float)) else str(value)
-        except Exception:
-            return None
-            
     return {tag: safe_convert(getattr(dcm, tag, None)) for tag in tags}
 
 
+# --- Fast-path header reader ---
+
+# resolve tag keywords to tag numbers once; keywords pydicom doesn't know
+# (e.g. "Private Creator") map to None and always extract as None
+def compile_tags(keywords):
+    return [(keyword, tag_for_keyword(keyword)) for keyword in keywords]
+
+
+# load the study/series/instance tag lists, compiled for the fast path
+def load_compiled_tags():
+    return (
+        compile_tags(load_tags(TAGS_CONF_FILE_STUDY)),
+        compile_tags(load_tags(TAGS_CONF_FILE_SERIES)),  # Can be different if desired
+        compile_tags(load_tags(TAGS_CONF_FILE_INSTANCE)),
+    )
+
+
+# union of the tag numbers needed by the compiled lists (plus the UIDs used for
+# grouping), sorted, so the reader can stop after the highest one
+def needed_tags(*compiled_lists):
+    tags = {tag for compiled in compiled_lists for _, tag in compiled if tag is not None}
+    tags.update(tag_for_keyword(keyword) for keyword in UID_KEYWORDS)
+    return sorted(tags)
+
+
+# Read only the needed elements of a header. Unneeded elements are skipped
+# without decoding, oversized values are deferred, and parsing stops at the
+# first element past the highest needed tag (large private groups included).
+def read_header(fpath, tags):
+    max_tag = tags[-1]
+    with open(fpath, "rb") as fp:
+        return read_partial(
+            fp,
+            stop_when=lambda tag, vr, length: tag > max_tag,
+            defer_size=DEFER_SIZE,
+            specific_tags=tags,
+        )
+
+
+# same output as extract_tags(), but looks elements up by precompiled tag number
+def extract_compiled_tags(dcm, compiled):
+    out = {}
+    for keyword, tag in compiled:
+        elem = dcm.get(tag) if tag is not None else None
+        out[keyword] = safe_convert(elem.value if elem is not None else None)
+    return out
+
+
 
 # yield every .dcm file in the directory
 def walk_dicom_files(base_dir):
@@ -88,6 +150,14 @@ def walk_dicom_files(base_dir):
             if file.lower().endswith(".dcm"):
                 yield os.path.join(root, file)
 
+# yield the .dcm files of each directory as one group (a single series per
+# directory in the usual PATIENT/STUDY/SERIES layout)
+def walk_dicom_dirs(base_dir):
+    for root, _, files in os.walk(base_dir):
+        group = [os.path.join(root, file) for file in files if file.lower().endswith(".dcm")]
+        if group:
+            yield group
+
 # Update missing or None fields in existing dict with values from new dict.
 def merge_tags(existing, new):
     for key, val in new.items():
@@ -96,19 +166,30 @@ def merge_tags(existing, new):
 
                
 
-def extract_metadata():
-    study_tags = load_tags(TAGS_CONF_FILE_STUDY)
-    series_tags = load_tags(TAGS_CONF_FILE_SERIES)  # Can be different if desired
-    instance_tags = load_tags(TAGS_CONF_FILE_INSTANCE)
-
+# split an iterable of file paths into lists of at most `size` paths
+def shard_files(paths, size):
+    it = iter(paths)
+    while True:
+        shard = list(islice(it, size))
+        if not shard:
+            return
+        yield shard
+
+
+# extract study/series/instance partial results from a shard of files
+# (runs inside the worker processes when extracting in parallel); the tag
+# lists are the compiled ones from load_compiled_tags()
+def extract_shard(paths, study_tags, series_tags, instance_tags):
+    tags = needed_tags(study_tags, series_tags, instance_tags)
     studies = {}
     series_data = {}
     instances = defaultdict(list)
 
-    for fpath in walk_dicom_files(PATIENT_DIR):
+    for fpath in paths:
         
         try:
-            dcm = pydicom.dcmread(fpath, stop_before_pixels=True)
+            st = os.stat(fpath)
+            dcm = read_header(fpath, tags)
 
             study_uid = dcm.StudyInstanceUID
             series_uid = dcm.SeriesInstanceUID
@@ -126,31 +207,123 @@ def extract_metadata():
 
 
              # Study (accumulate)
-            study_meta = extract_tags(dcm, study_tags)
+            study_meta = extract_compiled_tags(dcm, study_tags)
             if study_uid not in studies:
                 studies[study_uid] = {"metadata": study_meta}
             else:
                 merge_tags(studies[study_uid]["metadata"], study_meta)
 
             # Series (accumulate)
-            series_meta = extract_tags(dcm, series_tags)
+            series_meta = extract_compiled_tags(dcm, series_tags)
             if series_uid not in series_data:
                 series_data[series_uid] = {"study_uid": study_uid, "metadata": series_meta}
             else:
                 merge_tags(series_data[series_uid]["metadata"], series_meta)
 
             # Instance (one per file)
-            instance_meta = extract_tags(dcm, instance_tags)
+            instance_meta = extract_compiled_tags(dcm, instance_tags)
             instances[series_uid].append({
                 "sop_instance_uid": instance_uid,
                 "series_instance_uid": series_uid,
-                "metadata": instance_meta
+                "metadata": instance_meta,
+                "file": {"path": fpath, "size": st.st_size, "mtime": st.st_mtime}
             })
 
         except Exception as e:
             print(f"Failed to read {fpath}: {e}")
 
-    
+    return studies, series_data, instances
+
+
+# Merge a shard's partial results into the accumulated ones. Shards must be
+# merged in walk order so the first non-None value still wins, exactly as in
+# a single serial pass.
+def merge_partial(acc, partial):
+    studies, series_data, instances = acc
+    part_studies, part_series, part_instances = partial
+
+    for uid, data in part_studies.items():
+        if uid not in studies:
+            studies[uid] = data
+        else:
+            merge_tags(studies[uid]["metadata"], data["metadata"])
+
+    for uid, data in part_series.items():
+        if uid not in series_data:
+            series_data[uid] = data
+        else:
+            merge_tags(series_data[uid]["metadata"], data["metadata"])
+
+    for series_uid, inst_list in part_instances.items():
+        instances[series_uid].extend(inst_list)
+
+
+# Extract partial results for each shard, yielded in shard order. With more
+# than one worker the shards are parsed in a process pool, keeping at most a
+# few shards in flight so results don't pile up ahead of the consumer.
+def iter_partials(shards, study_tags, series_tags, instance_tags, workers):
+    if workers <= 1:
+        for paths in shards:
+            yield extract_shard(paths, study_tags, series_tags, instance_tags)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for paths in shards:
+            pending.append(pool.submit(extract_shard, paths, study_tags, series_tags, instance_tags))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+# skip files the manifest has already seen unchanged (incremental runs)
+def changed_files(paths, manifest):
+    if manifest is None:
+        return paths
+    return (path for path in paths if not manifest.is_unchanged(path))
+
+
+def extract_metadata(workers=None, manifest=None):
+    workers = workers or EXTRACT_WORKERS
+    study_tags, series_tags, instance_tags = load_compiled_tags()
+
+    # Partials come back in walk order, so the merged output is the same
+    # whatever the number of workers
+    acc = ({}, {}, defaultdict(list))
+    shards = shard_files(changed_files(walk_dicom_files(PATIENT_DIR), manifest), SHARD_SIZE)
+    for partial in iter_partials(shards, study_tags, series_tags, instance_tags, workers):
+        merge_partial(acc, partial)
+
+    return format_metadata(*acc)
+
+
+# Streaming variant of extract_metadata(): yields one batch per series directory
+# (split into SHARD_SIZE chunks) as soon as it is parsed, so memory is bounded by
+# the batches in flight instead of the archive size. Each study and series is
+# emitted once, with the batch it first appears in; tags that only show up in
+# later batches of the same study/series are not merged back.
+def iter_metadata(workers=None, manifest=None):
+    workers = workers or EXTRACT_WORKERS
+    study_tags, series_tags, instance_tags = load_compiled_tags()
+
+    shards = (
+        shard
+        for paths in walk_dicom_dirs(PATIENT_DIR)
+        for shard in shard_files(changed_files(paths, manifest), SHARD_SIZE)
+    )
+    seen_studies = set()
+    seen_series = set()
+    for studies, series_data, instances in iter_partials(shards, study_tags, series_tags, instance_tags, workers):
+        new_studies = {uid: data for uid, data in studies.items() if uid not in seen_studies}
+        new_series = {uid: data for uid, data in series_data.items() if uid not in seen_series}
+        seen_studies.update(new_studies)
+        seen_series.update(new_series)
+        yield format_metadata(new_studies, new_series, instances)
+
+
+# shape accumulated study/series/instance tags into the backend's documents
+def format_metadata(studies, series_data, instances):
     #Formatting data for inserting into DB:
 
     structured_studies = []
@@ -173,8 +346,10 @@ def extract_metadata():
         structured_series.append(out)
 
     structured_instances = []
+    files = []
     for series_uid, inst_list in instances.items():
         for inst in inst_list:
+            files.append({**inst["file"], "sop_instance_uid": inst["sop_instance_uid"]})
             out = {
                 "sop_instance_uid": inst["sop_instance_uid"],
                 "series_instance_uid": inst["series_instance_uid"]
@@ -187,7 +362,8 @@ def extract_metadata():
     return {
         "studies": structured_studies,
         "series": structured_series,
-        "instances": structured_instances
+        "instances": structured_instances,
+        "files": files
     }
 
 
@@ -0,0 +1,76 @@
+import os
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    sop_instance_uid TEXT
+);
+CREATE TABLE IF NOT EXISTS uploads (
+    level TEXT NOT NULL,
+    uid TEXT NOT NULL,
+    backend_id TEXT NOT NULL,
+    PRIMARY KEY (level, uid)
+);
+"""
+
+
+# Persistent record of every extracted file (path, size, mtime, SOPInstanceUID)
+# and of the backend ids of uploaded studies/series, kept in a local SQLite file.
+# A re-run only parses files that are new or whose size/mtime changed, and links
+# new series/instances to parents uploaded by earlier runs.
+class Manifest:
+    def __init__(self, path):
+        # The streaming driver reads from the extractor thread and writes from
+        # the event loop, so the connection is shared behind a lock
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.executescript(SCHEMA)
+
+    # True if the file was already extracted and has not changed since. A file
+    # that can't be stat'ed (deleted or rotated since the walk) counts as changed,
+    # so its shard reports the failure like any other unreadable file.
+    def is_unchanged(self, path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT size, mtime FROM files WHERE path = ?", (path,)
+            ).fetchone()
+        return row is not None and row[0] == st.st_size and row[1] == st.st_mtime
+
+    # files: iterable of {"path", "size", "mtime", "sop_instance_uid"} dicts
+    def record_files(self, files):
+        rows = [(f["path"], f["size"], f["mtime"], f["sop_instance_uid"]) for f in files]
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO files (path, size, mtime, sop_instance_uid) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self.conn.commit()
+
+    # return {uid: backend_id} for the given level ("study" or "series")
+    def uploaded_ids(self, level):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT uid, backend_id FROM uploads WHERE level = ?", (level,)
+            ).fetchall()
+        return dict(rows)
+
+    def record_uploads(self, level, uid_to_id):
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO uploads (level, uid, backend_id) VALUES (?, ?, ?)",
+                [(level, uid, backend_id) for uid, backend_id in uid_to_id.items()]
+            )
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()